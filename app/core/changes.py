@@ -0,0 +1,67 @@
+import asyncio
+
+from app.models.patient_change import PatientChange
+from nuvie_db.nuvie.models.patient import Patient
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Iterable
+
+OP_CREATE = 'create'
+OP_UPDATE = 'update'
+OP_DELETE = 'delete'
+
+## Chave fixa do advisory lock que serializa as escritas no log.
+## Sem isso, duas transações concorrentes podem commitar fora da ordem
+## do `seq` e um consumidor que já avançou o cursor perderia a menor.
+_CHANGE_LOG_LOCK_KEY = 7_262_026
+
+_changes_event = asyncio.Event()
+
+
+async def record_patient_changes(
+    session: AsyncSession, operation: str, patients: Iterable[Patient]
+) -> None:
+    """
+    Registra alterações de pacientes no log, dentro da transação corrente.
+    Deve ser chamado imediatamente antes do commit.
+    """
+    changes = [
+        PatientChange(
+            patient_id=patient.id,
+            operation=operation,
+            data=(
+                None
+                if operation == OP_DELETE
+                else patient.model_dump(mode='json')
+            ),
+        )
+        for patient in patients
+    ]
+    if not changes:
+        return
+
+    await session.exec(
+        text('SELECT pg_advisory_xact_lock(:key)'),
+        params={'key': _CHANGE_LOG_LOCK_KEY},
+    )
+    session.add_all(changes)
+
+
+def notify_patient_changes() -> None:
+    """
+    Acorda os long-polls deste processo após um commit com alterações.
+    """
+    global _changes_event
+    _changes_event.set()
+    _changes_event = asyncio.Event()
+
+
+async def wait_for_patient_changes(timeout: float) -> None:
+    """
+    Aguarda uma alteração local ou o timeout, o que vier primeiro.
+    Escritas de outros workers são percebidas pelo próximo poll.
+    """
+    try:
+        await asyncio.wait_for(_changes_event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
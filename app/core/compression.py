@@ -0,0 +1,236 @@
+import anyio
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'text/',
+    'application/javascript',
+    'application/xml',
+)
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+    def compress_all(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self.finish()
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+    def compress_all(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+    def compress_all(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self.finish()
+
+
+def available_encoders() -> dict:
+    """
+    Codificações suportadas, em ordem de preferência do servidor.
+    zstd e br só entram se as bibliotecas opcionais estiverem instaladas.
+    """
+    encoders = {}
+    if zstandard is not None:
+        encoders['zstd'] = _ZstdEncoder
+    if brotli is not None:
+        encoders['br'] = _BrotliEncoder
+    encoders['gzip'] = _GzipEncoder
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, supported) -> str | None:
+    """
+    Escolhe a codificação a partir do header Accept-Encoding.
+    Maior q-value vence; em empate vale a ordem de `supported`.
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    wildcard = weights.get('*', 0.0)
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime respostas com zstd, br ou gzip,
+    negociando pelo Accept-Encoding.
+
+    Respostas menores que `minimum_size` passam sem compressão.
+    Respostas em streaming são comprimidas chunk a chunk, e bodies maiores
+    que `thread_threshold` são comprimidos numa thread para não bloquear
+    o event loop.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        thread_threshold: int = 256 * 1024,
+        levels: dict | None = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_threshold = thread_threshold
+        self.encoders = available_encoders()
+        self.levels = {'zstd': 3, 'br': 4, 'gzip': 6, **(levels or {})}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        encoding = negotiate_encoding(accept_encoding, self.encoders)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: str, send: Send
+    ):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message: Message | None = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def _run(self, func, data: bytes) -> bytes:
+        if len(data) >= self.middleware.thread_threshold:
+            return await anyio.to_thread.run_sync(func, data)
+        return func(data)
+
+    def _is_compressible(self, headers: Headers) -> bool:
+        if 'content-encoding' in headers:
+            return False
+        content_type = headers.get('content-type', '')
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _start_encoding(self) -> MutableHeaders:
+        self.encoder = self.middleware.encoders[self.encoding](
+            self.middleware.levels[self.encoding]
+        )
+        headers = MutableHeaders(raw=self.start_message['headers'])
+        headers['Content-Encoding'] = self.encoding
+        headers.add_vary_header('Accept-Encoding')
+        return headers
+
+    async def send(self, message: Message) -> None:
+        message_type = message['type']
+
+        if message_type == 'http.response.start':
+            self.start_message = message
+            headers = Headers(raw=message['headers'])
+            self.passthrough = not self._is_compressible(headers)
+            return
+
+        if message_type != 'http.response.body' or self.passthrough:
+            if self.start_message is not None:
+                await self.downstream(self.start_message)
+                self.start_message = None
+            await self.downstream(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.start_message is not None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.downstream(self.start_message)
+                self.start_message = None
+                await self.downstream(message)
+                return
+
+            headers = self._start_encoding()
+            if more_body:
+                del headers['Content-Length']
+            else:
+                body = await self._run(self.encoder.compress_all, body)
+                headers['Content-Length'] = str(len(body))
+                await self.downstream(self.start_message)
+                self.start_message = None
+                await self.downstream(
+                    {'type': 'http.response.body', 'body': body}
+                )
+                return
+            await self.downstream(self.start_message)
+            self.start_message = None
+
+        chunk = await self._run(self.encoder.compress, body) if body else b''
+        if not more_body:
+            chunk += self.encoder.finish()
+        await self.downstream(
+            {
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': more_body,
+            }
+        )
@@ -3,6 +3,7 @@ import enum
 from dotenv import load_dotenv
 from pydantic import computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Literal
 
 load_dotenv()
 
@@ -65,5 +66,58 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 720
     SECRET_KEY: str = ''
 
+    ## Cache de SQL compilado do SQLAlchemy (por engine) e de prepared
+    ## statements do asyncpg (por connection). Usar 0 no prepared statement
+    ## cache atrás de pgbouncer em modo transaction.
+    DB_QUERY_CACHE_SIZE: int = 1200
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 500
+
+    PATIENT_CHANGES_POLL_INTERVAL: float = 1.0
+
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_THREAD_THRESHOLD: int = 256 * 1024
+
+    IDEMPOTENCY_KEY_TTL: int = 24 * 60 * 60
+    IDEMPOTENCY_LOCK_TIMEOUT: float = 30.0
+    IDEMPOTENCY_POLL_INTERVAL: float = 0.05
+    IDEMPOTENCY_PURGE_INTERVAL: float = 300.0
+
+    QUERY_MONITOR_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+    SLOW_QUERY_EXPLAIN_SAMPLE_RATE: float = 0.0
+    QUERY_COUNT_WARN_THRESHOLD: int = 20
+
+    PROFILING_ENABLED: bool = False
+    PROFILING_ADMIN_USER_IDS: list[str] = []
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_DIR: str = '/tmp/nuvie-profiles'
+    PROFILING_MAX_FILES: int = 200
+    PROFILING_TEXT_LIMIT: int = 60
+
+    IMPORT_UPLOAD_DIR: str = '/tmp/nuvie-imports'
+    IMPORT_MAX_UPLOAD_BYTES: int = 2 * 1024 * 1024 * 1024
+    IMPORT_MAX_CONCURRENT_JOBS: int = 1
+    IMPORT_BATCH_SIZE: int = 500
+    IMPORT_BATCH_PAUSE: float = 0.01
+    ## Jobs em andamento atualizam heartbeat_at nesse intervalo; os que
+    ## ficam parados por IMPORT_JOB_STALE_SECONDS (worker morto) voltam
+    ## para a fila de algum worker vivo.
+    IMPORT_JOB_HEARTBEAT_SECONDS: float = 30
+    IMPORT_JOB_STALE_SECONDS: float = 300
+
+    ## Calibrado com patient_generator (duplicate_rate=0.1, 20 mil linhas):
+    ## em 0.7 a precisão fica em ~99% e o recall em ~70%
+    DEDUP_SCORE_THRESHOLD: float = 0.7
+    DEDUP_MAX_BLOCK_SIZE: int = 500
+    ## Pontua os candidatos na escrita; desligado, o endpoint de possíveis
+    ## duplicados só vê o que o último find_duplicates.py gravou
+    DEDUP_SCORE_ON_WRITE: bool = True
+
+    ## Layout da tabela de pacientes: 'none', 'hash' (por id) ou 'list'
+    ## (por estado). Tem que bater com o que partition_patients.py criou.
+    PATIENT_PARTITIONING: Literal['none', 'hash', 'list'] = 'none'
+    PATIENT_HASH_PARTITIONS: int = 16
+
 
 settings = Settings()
@@ -1,14 +1,39 @@
 from app.core.config import settings
+from app.core.query_monitor import install_query_monitor
+from sqlalchemy import any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Iterable
+
+## asyncpg aceita no máximo 32767 parâmetros por statement
+MAX_BIND_PARAMS = 30000
+
+
+def any_of(column, values: Iterable):
+    """
+    `column IN values` com a lista num único parâmetro (array), para não
+    esbarrar no limite de parâmetros do asyncpg com listas grandes.
+    """
+    return column == any_(literal(list(values), ARRAY(column.type)))
 
 
 async_engine = create_async_engine(
-    settings.sqlalchemy_db_uri, echo=False, future=True
+    settings.sqlalchemy_db_uri,
+    echo=False,
+    future=True,
+    query_cache_size=settings.DB_QUERY_CACHE_SIZE,
+    connect_args={
+        'prepared_statement_cache_size': (
+            settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+        ),
+    },
 )
 
+if settings.QUERY_MONITOR_ENABLED:
+    install_query_monitor(async_engine)
+
 async_session = sessionmaker(
     bind=async_engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -0,0 +1,464 @@
+import numpy as np
+import re
+import unicodedata
+import zlib
+
+from app.core.config import settings
+from app.core.db import any_of
+from app.core.logger import log as logger
+from app.models.patient_duplicate import (
+    PatientBlockingKey,
+    PatientDuplicateCandidate,
+)
+from nuvie_db.nuvie.models.patient import Patient
+from sqlalchemy import delete, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Any, Iterable
+
+NAME_PREFIXES = {'mr', 'mrs', 'ms', 'miss', 'dr'}
+BIGRAM_DIM = 512
+## Linhas por INSERT, abaixo do limite de parâmetros do asyncpg
+INSERT_CHUNK_SIZE = 5000
+
+## Pesos do score final (somam 1)
+WEIGHT_NAME = 0.45
+WEIGHT_SSN = 0.25
+WEIGHT_BIRTH_DATE = 0.15
+WEIGHT_ZIP = 0.15
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+MATCH_COLUMNS = (
+    Patient.id,
+    Patient.full_name,
+    Patient.SSN,
+    Patient.birth_date,
+    Patient.zip_code,
+)
+MATCH_FIELDS = frozenset(column.key for column in MATCH_COLUMNS[1:])
+
+
+def affects_matching(fields: Iterable[str]) -> bool:
+    """
+    Se algum dos campos usados nas chaves e no score mudou. Sem isso
+    (ex: só cidade ou cobertura), não há por que reindexar o paciente.
+    """
+    return not MATCH_FIELDS.isdisjoint(fields)
+
+
+def name_tokens(full_name: str | None) -> list[str]:
+    """
+    Normaliza o nome: sem acentos, sem dígitos (ex: `Alexis664`),
+    sem pronomes de tratamento.
+    """
+    if not full_name:
+        return []
+    ascii_name = (
+        unicodedata.normalize('NFKD', full_name)
+        .encode('ascii', 'ignore')
+        .decode()
+        .lower()
+    )
+    tokens = re.sub(r'[^a-z\s]', ' ', ascii_name).split()
+    return [t for t in tokens if t not in NAME_PREFIXES]
+
+
+def soundex(word: str) -> str:
+    if not word:
+        return ''
+    first, code, last = word[0].upper(), [], _SOUNDEX_CODES.get(word[0], '')
+    for char in word[1:]:
+        digit = _SOUNDEX_CODES.get(char, '')
+        if digit and digit != last:
+            code.append(digit)
+        if char not in 'hw':
+            last = digit
+    return (first + ''.join(code) + '000')[:4]
+
+
+def _digits(value: str | None) -> str:
+    return re.sub(r'\D', '', value or '')
+
+
+def _zip(value: str | None) -> str:
+    """
+    CEP com 5 dígitos; repõe zeros à esquerda perdidos em planilhas.
+    """
+    digits = _digits(value)[:5]
+    return digits.zfill(5) if digits else ''
+
+
+def blocking_keys(patient: Any) -> set[str]:
+    """
+    Chaves de blocking: data de nascimento + fonético do sobrenome,
+    data de nascimento + CEP, fonético do nome completo + CEP e SSN
+    normalizado (pega o mesmo SSN em formatos diferentes).
+    """
+    tokens = name_tokens(patient.full_name)
+    first = soundex(tokens[0]) if tokens else ''
+    last = soundex(tokens[-1]) if tokens else ''
+    birth_date = (
+        patient.birth_date.date().isoformat() if patient.birth_date else ''
+    )
+    zip_code = _zip(patient.zip_code)
+    ssn = _digits(patient.SSN)
+
+    keys = set()
+    if birth_date and last:
+        keys.add(f'dob_last:{birth_date}:{last}')
+    if birth_date and zip_code:
+        keys.add(f'dob_zip:{birth_date}:{zip_code}')
+    if first and last and zip_code:
+        keys.add(f'name_zip:{first}{last}:{zip_code}')
+    if len(ssn) == 9:
+        keys.add(f'ssn:{ssn}')
+    return keys
+
+
+def _features(records: list) -> dict[str, np.ndarray]:
+    """
+    Converte os registros em matrizes para o score vetorizado.
+    """
+    size = len(records)
+    names = np.zeros((size, BIGRAM_DIM), dtype=np.float32)
+    ssns = np.full((size, 9), -1, dtype=np.int8)
+    birth_dates = np.full(size, -1, dtype=np.int64)
+    zips = np.empty(size, dtype=object)
+
+    for i, record in enumerate(records):
+        padded = f' {" ".join(name_tokens(record.full_name))} '
+        for j in range(len(padded) - 1):
+            names[i, zlib.crc32(padded[j : j + 2].encode()) % BIGRAM_DIM] += 1
+        ssn = _digits(record.SSN)
+        if len(ssn) == 9:
+            ssns[i] = np.frombuffer(ssn.encode(), dtype=np.uint8) - ord('0')
+        if record.birth_date:
+            birth_dates[i] = record.birth_date.toordinal()
+        zips[i] = _zip(record.zip_code) or None
+
+    norms = np.linalg.norm(names, axis=1, keepdims=True)
+    names /= np.where(norms == 0, 1, norms)
+    return {
+        'names': names,
+        'ssns': ssns,
+        'birth_dates': birth_dates,
+        'zips': zips,
+    }
+
+
+def score_matrix(left: dict, right: dict) -> np.ndarray:
+    """
+    Score de similaridade de todos os pares (left x right), em [0, 1].
+    """
+    name_score = left['names'] @ right['names'].T
+
+    left_ssn, right_ssn = left['ssns'][:, None, :], right['ssns'][None, :, :]
+    ssn_known = (left_ssn[..., 0] >= 0) & (right_ssn[..., 0] >= 0)
+    ssn_score = (left_ssn == right_ssn).mean(axis=-1)
+
+    birth_score = (
+        (left['birth_dates'][:, None] == right['birth_dates'][None, :])
+        & (left['birth_dates'][:, None] >= 0)
+    ).astype(np.float32)
+
+    zip_score = (
+        (left['zips'][:, None] == right['zips'][None, :])
+        & (left['zips'][:, None] != None)  # noqa: E711 - comparação vetorizada
+    ).astype(np.float32)
+
+    ## SSN ausente ou malformado em um dos lados não conta contra o par:
+    ## o peso dele sai e os outros são renormalizados. Só um SSN conhecido
+    ## e diferente pesa contra.
+    other = (
+        WEIGHT_NAME * name_score
+        + WEIGHT_BIRTH_DATE * birth_score
+        + WEIGHT_ZIP * zip_score
+    )
+    return np.where(
+        ssn_known, other + WEIGHT_SSN * ssn_score, other / (1 - WEIGHT_SSN)
+    )
+
+
+def _pair(a: str, b: str, score: float) -> dict:
+    first, second = sorted((a, b))
+    return {
+        'patient_id': first,
+        'candidate_id': second,
+        'score': round(float(score), 4),
+    }
+
+
+async def _store_candidates(session: AsyncSession, pairs: list[dict]) -> None:
+    for start in range(0, len(pairs), INSERT_CHUNK_SIZE):
+        statement = insert(PatientDuplicateCandidate).values(
+            pairs[start : start + INSERT_CHUNK_SIZE]
+        )
+        await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=[
+                    PatientDuplicateCandidate.patient_id,
+                    PatientDuplicateCandidate.candidate_id,
+                ],
+                set_={
+                    'score': statement.excluded.score,
+                    'updated_at': func.now(),
+                },
+            )
+        )
+
+
+async def _store_keys(session: AsyncSession, rows: list) -> None:
+    keys = [
+        {'key': key, 'patient_id': row.id}
+        for row in rows
+        for key in blocking_keys(row)
+    ]
+    for start in range(0, len(keys), INSERT_CHUNK_SIZE):
+        await session.exec(
+            insert(PatientBlockingKey)
+            .values(keys[start : start + INSERT_CHUNK_SIZE])
+            .on_conflict_do_nothing()
+        )
+
+
+async def unindex_patients(
+    session: AsyncSession, patient_ids: Iterable[str]
+) -> None:
+    """
+    Remove chaves e pares de duplicidade dos pacientes.
+    """
+    patient_ids = list(patient_ids)
+    if not patient_ids:
+        return
+    await session.exec(
+        delete(PatientBlockingKey).where(
+            any_of(PatientBlockingKey.patient_id, patient_ids)
+        )
+    )
+    await session.exec(
+        delete(PatientDuplicateCandidate).where(
+            or_(
+                any_of(PatientDuplicateCandidate.patient_id, patient_ids),
+                any_of(PatientDuplicateCandidate.candidate_id, patient_ids),
+            )
+        )
+    )
+
+
+async def find_possible_duplicates(
+    session: AsyncSession, patients: list, threshold: float | None = None
+) -> list[dict]:
+    """
+    Compara os pacientes dados com os que compartilham alguma chave de
+    blocking no índice. Retorna os pares com score acima do limite.
+    """
+    if threshold is None:
+        threshold = settings.DEDUP_SCORE_THRESHOLD
+    keys_by_patient = {p.id: blocking_keys(p) for p in patients}
+    all_keys = set().union(*keys_by_patient.values())
+    if not all_keys:
+        return []
+
+    result = await session.exec(
+        select(PatientBlockingKey).where(
+            any_of(PatientBlockingKey.key, all_keys)
+        )
+    )
+    members_by_key: dict[str, list[str]] = {}
+    for row in result.all():
+        members_by_key.setdefault(row.key, []).append(row.patient_id)
+
+    candidates_by_patient = {}
+    for patient_id, keys in keys_by_patient.items():
+        candidate_ids = set()
+        for key in keys:
+            members = members_by_key.get(key, [])
+            if len(members) > settings.DEDUP_MAX_BLOCK_SIZE:
+                continue
+            candidate_ids.update(members)
+        candidate_ids.discard(patient_id)
+        candidates_by_patient[patient_id] = sorted(candidate_ids)
+
+    candidate_ids = set().union(*candidates_by_patient.values())
+    if not candidate_ids:
+        return []
+    result = await session.exec(
+        select(*MATCH_COLUMNS).where(any_of(Patient.id, candidate_ids))
+    )
+    records = {row.id: row for row in result.all()}
+
+    ## Dois pacientes do mesmo lote acham um ao outro: o par entra uma vez só
+    pairs = {}
+    for patient in patients:
+        others = [
+            records[c]
+            for c in candidates_by_patient[patient.id]
+            if c in records
+        ]
+        if not others:
+            continue
+        scores = score_matrix(_features([patient]), _features(others))[0]
+        for other, score in zip(others, scores):
+            if score >= threshold:
+                pair = _pair(patient.id, other.id, score)
+                pairs[pair['patient_id'], pair['candidate_id']] = pair
+    return list(pairs.values())
+
+
+async def index_patients(session: AsyncSession, patients: list) -> None:
+    """
+    Atualiza as chaves de blocking dos pacientes e, se habilitado, já
+    pontua os novos candidatos a duplicidade (scoring incremental).
+    Deve rodar na mesma transação da escrita, antes do
+    record_patient_changes: nada disso precisa do lock do log.
+    """
+    if not patients:
+        return
+    await unindex_patients(session, [p.id for p in patients])
+    await _store_keys(session, patients)
+
+    if settings.DEDUP_SCORE_ON_WRITE:
+        pairs = await find_possible_duplicates(session, patients)
+        await _store_candidates(session, pairs)
+
+
+async def stored_duplicates(
+    session: AsyncSession, patient_id: str, min_score: float | None = None
+) -> dict[str, float]:
+    """
+    Pares já pontuados do paciente (na escrita ou pelo rebuild), como
+    {id do outro paciente: score}.
+    """
+    if min_score is None:
+        min_score = settings.DEDUP_SCORE_THRESHOLD
+    result = await session.exec(
+        select(PatientDuplicateCandidate).where(
+            or_(
+                PatientDuplicateCandidate.patient_id == patient_id,
+                PatientDuplicateCandidate.candidate_id == patient_id,
+            ),
+            PatientDuplicateCandidate.score >= min_score,
+        )
+    )
+    return {
+        pair.candidate_id
+        if pair.patient_id == patient_id
+        else pair.patient_id: pair.score
+        for pair in result.all()
+    }
+
+
+async def rebuild_duplicate_index(
+    session_factory, batch_size: int = 1000
+) -> dict:
+    """
+    Job em lote: recalcula as chaves de todos os pacientes e pontua
+    todos os pares dentro de cada bloco, de forma vetorizada. No fim
+    remove os pares que o job não regravou (abaixo de um limite novo,
+    dados corrigidos), sem esvaziar a tabela enquanto roda.
+    """
+    async with session_factory() as session:
+        started = (await session.exec(select(func.localtimestamp()))).one()
+
+    processed, last_id = 0, ''
+    while True:
+        async with session_factory() as session:
+            result = await session.exec(
+                select(*MATCH_COLUMNS)
+                .where(Patient.id > last_id)
+                .order_by(Patient.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            await session.exec(
+                delete(PatientBlockingKey).where(
+                    any_of(PatientBlockingKey.patient_id, [r.id for r in rows])
+                )
+            )
+            await _store_keys(session, rows)
+            await session.commit()
+        processed += len(rows)
+        last_id = rows[-1].id
+        logger.info(f'Chaves de blocking recalculadas: {processed}')
+
+    pair_count, block_count, skipped_blocks, last_key = 0, 0, 0, ''
+    while True:
+        async with session_factory() as session:
+            result = await session.exec(
+                select(
+                    PatientBlockingKey.key,
+                    func.array_agg(PatientBlockingKey.patient_id),
+                )
+                .where(PatientBlockingKey.key > last_key)
+                .group_by(PatientBlockingKey.key)
+                .having(func.count() > 1)
+                .order_by(PatientBlockingKey.key)
+                .limit(batch_size)
+            )
+            blocks = result.all()
+            if not blocks:
+                break
+            last_key = blocks[-1][0]
+
+            ## Blocos enormes (ex: data de nascimento muito comum no mesmo
+            ## CEP) ficam de fora: o custo é quadrático no tamanho do bloco
+            page_size = len(blocks)
+            blocks = [
+                (key, members)
+                for key, members in blocks
+                if len(members) <= settings.DEDUP_MAX_BLOCK_SIZE
+            ]
+            skipped_blocks += page_size - len(blocks)
+            member_ids = {m for _, members in blocks for m in members}
+            result = await session.exec(
+                select(*MATCH_COLUMNS).where(any_of(Patient.id, member_ids))
+            )
+            records = {row.id: row for row in result.all()}
+
+            pairs = {}
+            for _, members in blocks:
+                block = [records[m] for m in members if m in records]
+                features = _features(block)
+                scores = score_matrix(features, features)
+                left, right = np.triu_indices(len(block), k=1)
+                hits = scores[left, right] >= settings.DEDUP_SCORE_THRESHOLD
+                for i, j in zip(left[hits], right[hits]):
+                    pair = _pair(block[i].id, block[j].id, scores[i, j])
+                    key = (pair['patient_id'], pair['candidate_id'])
+                    pairs[key] = pair
+                block_count += 1
+
+            await _store_candidates(session, list(pairs.values()))
+            await session.commit()
+            pair_count += len(pairs)
+
+    ## Os pares regravados pelo job (ou por escritas durante ele) têm
+    ## updated_at posterior ao início; o resto ficou velho.
+    async with session_factory() as session:
+        result = await session.exec(
+            delete(PatientDuplicateCandidate).where(
+                PatientDuplicateCandidate.updated_at < started
+            )
+        )
+        await session.commit()
+
+    summary = {
+        'patients': processed,
+        'blocks': block_count,
+        'pairs': pair_count,
+        'skipped_blocks': skipped_blocks,
+        'stale_pairs': result.rowcount,
+    }
+    logger.info('Índice de duplicados reconstruído', **summary)
+    return summary
@@ -3,47 +3,57 @@ import jwt
 from app.core import security
 from app.core.config import settings
 from app.core.db import async_session
+from app.core.queries import user_by_id
 from nuvie_db.nuvie.dto import TokenPayload
 from nuvie_db.nuvie.models.user import User
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
-from typing import Annotated, Type
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Annotated, AsyncGenerator, Type
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl=f'/api/v1/users/login/access-token')
 
 ## README.md
-## Deixei esse pattern escrito aqui porque é muito comum em projetos.
-## Mas pelo fato de como o FastAPI funciona com o SQLModel
-## quando você deixa o unicorn/fastapi gerenciar a abertura de Session do banco (Deps)
-## Ele deixa as connections por thread (workes) abertas
-## (trabalhar com thread em python é uma bagunça)
-## E como queremos microserviços altamente escaláveis,
-## essas conections em iddle podem derrubar o banco
-async def get_db():
+## Uma única sessão por requisição, compartilhada pela autenticação e pela rota
+## (o FastAPI reaproveita o mesmo Depends dentro da requisição).
+## O medo antigo era de connections em idle presas à sessão do Depends,
+## o que pode derrubar o banco. Isso não acontece aqui porque:
+## - a AsyncSession só pega uma connection do pool na primeira query;
+## - o commit (ou o fim da sessão) devolve a connection ao pool;
+## - o get_db tem scope='function': o FastAPI fecha a sessão assim que a
+##   rota retorna, antes de mandar a resposta (o padrão, desde a 0.118, é
+##   fechar depois dela). tests/test_deps.py cobre esse comportamento.
+## Rotas que esperam muito sem usar o banco (long-poll, upload) devem chamar
+## release_connection antes de esperar.
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with async_session() as session:
         yield session
 
 
-SessionDep = Annotated[Session, Depends(get_db)]
+SessionDep = Annotated[AsyncSession, Depends(get_db, scope='function')]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-async def get_current_user(token: TokenDep) -> Type[User]:
-    async with async_session() as session:
-        try:
-            payload = jwt.decode(
-                token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-            )
-            token_data = TokenPayload(**payload)
-        except Exception as e:
-            await session.close()
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail='Could not validate credentials',
-            )
-        user = await session.get(User, token_data.sub)
-        await session.close()
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Devolve a connection da sessão ao pool sem descartar os objetos
+    carregados (expire_on_commit=False). A próxima query pega outra.
+    """
+    await session.commit()
+
+
+async def get_current_user(session: SessionDep, token: TokenDep) -> Type[User]:
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+        token_data = TokenPayload(**payload)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail='Could not validate credentials',
+        )
+    user = (await session.scalars(user_by_id(token_data.sub))).first()
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
     return user
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import time
+import weakref
+
+from app.core.config import settings
+from app.core.db import async_session
+from app.core.deps import release_connection
+from app.core.logger import log as logger
+from app.models.idempotency import IdempotencyRecord
+from datetime import timedelta
+from fastapi import Header, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, delete, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Annotated, Any, Awaitable, Callable
+
+IdempotencyKeyHeader = Annotated[
+    str | None, Header(alias='Idempotency-Key', max_length=255)
+]
+
+## Locks locais: requisições duplicadas no mesmo worker esperam aqui
+## em vez de ficar consultando o banco.
+_local_locks: weakref.WeakValueDictionary[
+    str, asyncio.Lock
+] = weakref.WeakValueDictionary()
+_last_purge = 0.0
+
+
+def _request_hash(payload: Any) -> str:
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _replay(record: IdempotencyRecord) -> JSONResponse:
+    return JSONResponse(
+        status_code=record.status_code,
+        content=record.response_body,
+        headers={'Idempotent-Replayed': 'true'},
+    )
+
+
+async def _claim(
+    key: str, request_hash: str
+) -> tuple[bool, IdempotencyRecord | None]:
+    """
+    Tenta reservar a chave. Retorna (True, None) se esta requisição
+    deve executar, ou (False, registro) se outra já a reservou.
+    """
+    global _last_purge
+    lock_timeout = timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+
+    async with async_session() as session:
+        now = time.monotonic()
+        if now - _last_purge > settings.IDEMPOTENCY_PURGE_INTERVAL:
+            _last_purge = now
+            await session.exec(
+                delete(IdempotencyRecord).where(
+                    IdempotencyRecord.expires_at < func.now()
+                )
+            )
+
+        ## Libera chaves vencidas ou presas por uma requisição que morreu
+        await session.exec(
+            delete(IdempotencyRecord).where(
+                IdempotencyRecord.key == key,
+                or_(
+                    IdempotencyRecord.expires_at < func.now(),
+                    and_(
+                        IdempotencyRecord.status_code.is_(None),
+                        IdempotencyRecord.heartbeat_at
+                        < func.now() - lock_timeout,
+                    ),
+                ),
+            )
+        )
+        result = await session.exec(
+            insert(IdempotencyRecord)
+            .values(
+                key=key,
+                request_hash=request_hash,
+                expires_at=func.now()
+                + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            )
+            .on_conflict_do_nothing()
+            .returning(IdempotencyRecord.key)
+        )
+        claimed = result.first() is not None
+        record = None if claimed else await session.get(IdempotencyRecord, key)
+        await session.commit()
+
+    return claimed, record
+
+
+async def _heartbeat(key: str) -> None:
+    """
+    Renova a reserva enquanto a ação roda, para uma escrita longa (ex:
+    PATCH em lote) não ser tomada e executada de novo por uma retentativa.
+    """
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_LOCK_TIMEOUT / 3)
+        try:
+            async with async_session() as session:
+                await session.exec(
+                    update(IdempotencyRecord)
+                    .where(IdempotencyRecord.key == key)
+                    .values(heartbeat_at=func.now())
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(
+                'Falha ao renovar Idempotency-Key', key=key, error=str(e)
+            )
+
+
+async def _store(
+    session: AsyncSession, key: str, status_code: int, body: Any
+) -> None:
+    """
+    Grava a resposta na transação da sessão dada, sem commitar.
+    """
+    await session.exec(
+        update(IdempotencyRecord)
+        .where(IdempotencyRecord.key == key)
+        .values(status_code=status_code, response_body=body)
+    )
+
+
+async def _release(key: str) -> None:
+    async with async_session() as session:
+        await session.exec(
+            delete(IdempotencyRecord).where(IdempotencyRecord.key == key)
+        )
+        await session.commit()
+
+
+async def run_idempotent(
+    *,
+    scope: str,
+    user_id: Any,
+    key: str | None,
+    payload: Any,
+    action: Callable[[], Awaitable[Any]],
+    session: AsyncSession,
+    response_model: Any = None,
+) -> Any:
+    """
+    Executa `action` uma única vez por Idempotency-Key.
+
+    A primeira requisição grava a resposta; repetições com a mesma chave
+    recebem a resposta gravada e duplicatas concorrentes aguardam a original
+    terminar. Sem chave, `action` é executada normalmente.
+
+    `session` é a sessão da requisição. `action` escreve nela sem
+    commitar: o commit é feito aqui, junto com a resposta gravada, para um
+    crash entre os dois não deixar a chave sem resposta e a escrita ser
+    refeita na retentativa. A connection dela volta ao pool enquanto uma
+    duplicata aguarda.
+    """
+    if not key:
+        result = await action()
+        await session.commit()
+        return result
+
+    storage_key = f'{scope}:{user_id}:{key}'
+    request_hash = _request_hash(payload)
+
+    lock = _local_locks.get(storage_key)
+    if lock is None:
+        lock = _local_locks.setdefault(storage_key, asyncio.Lock())
+
+    async with lock:
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+        while True:
+            claimed, record = await _claim(storage_key, request_hash)
+            if claimed:
+                break
+            if record is not None:
+                if record.request_hash != request_hash:
+                    raise HTTPException(
+                        status_code=422,
+                        detail='Idempotency-Key já utilizada com outro conteúdo',
+                    )
+                if record.status_code is not None:
+                    return _replay(record)
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail='Requisição com esta Idempotency-Key em andamento',
+                )
+            await release_connection(session)
+            await asyncio.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+        heartbeat = asyncio.create_task(_heartbeat(storage_key))
+        try:
+            result = await action()
+            if response_model is not None:
+                result = response_model.model_validate(
+                    result, from_attributes=True
+                )
+            body = jsonable_encoder(result)
+            await _store(session, storage_key, 200, body)
+            await session.commit()
+        except HTTPException as e:
+            await session.rollback()
+            if e.status_code >= 500:
+                await _release(storage_key)
+                raise
+            await _store(
+                session, storage_key, e.status_code, {'detail': e.detail}
+            )
+            await session.commit()
+            raise
+        except BaseException:
+            await session.rollback()
+            await _release(storage_key)
+            raise
+        finally:
+            heartbeat.cancel()
+
+        return JSONResponse(content=body)
@@ -0,0 +1,236 @@
+import anyio
+import asyncio
+
+from app.core.config import settings
+from app.core.db import async_session
+from app.core.logger import log as logger
+from app.core.patient_import import import_patients_from_csv
+from app.models.patient_import import (
+    PatientImportJob,
+    PatientImportJobPublic,
+)
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Request
+from pathlib import Path
+from sqlalchemy import func, update
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+## Limita quantas importações rodam ao mesmo tempo por worker,
+## para que não disputem o event loop e o pool com o tráfego da API.
+_job_slots = asyncio.Semaphore(settings.IMPORT_MAX_CONCURRENT_JOBS)
+_running_tasks: set[asyncio.Task] = set()
+
+
+def upload_path(job_id: str) -> Path:
+    return Path(settings.IMPORT_UPLOAD_DIR) / f'{job_id}.csv'
+
+
+async def spool_upload(request: Request, target: Path) -> int:
+    """
+    Grava o corpo da requisição (o CSV cru) em disco em chunks, sem passar
+    pelo parser de multipart e sem carregar o arquivo em memória.
+    O limite é conferido pelo Content-Length antes de ler qualquer byte e
+    de novo durante a cópia, para uploads sem Content-Length.
+    """
+    declared = request.headers.get('content-length', '')
+    if declared.isdigit() and int(declared) > settings.IMPORT_MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413, detail='Arquivo maior que o limite permitido'
+        )
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    size = 0
+    try:
+        async with await anyio.open_file(target, 'wb') as out:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > settings.IMPORT_MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail='Arquivo maior que o limite permitido',
+                    )
+                await out.write(chunk)
+        if not size:
+            raise HTTPException(status_code=400, detail='Arquivo vazio')
+    except BaseException:
+        target.unlink(missing_ok=True)
+        raise
+    return size
+
+
+def job_public(job: PatientImportJob) -> PatientImportJobPublic:
+    """
+    Monta a visão pública do job com progresso e linhas/segundo.
+    """
+    progress = (
+        job.processed_bytes / job.total_bytes if job.total_bytes else 0.0
+    )
+    if job.status == STATUS_COMPLETED:
+        progress = 1.0
+
+    rows_per_second = None
+    if job.started_at:
+        end = job.finished_at or datetime.utcnow()
+        elapsed = (end - job.started_at).total_seconds()
+        if elapsed > 0:
+            rows_per_second = round(job.processed_rows / elapsed, 2)
+
+    return PatientImportJobPublic(
+        **job.model_dump(),
+        progress=round(progress, 4),
+        rows_per_second=rows_per_second,
+    )
+
+
+async def _update_job(job_id: str, **values) -> None:
+    async with async_session() as session:
+        await session.exec(
+            update(PatientImportJob)
+            .where(PatientImportJob.id == job_id)
+            .values(**values)
+        )
+        await session.commit()
+
+
+def _counts_to_columns(counts: dict) -> dict:
+    return {
+        'processed_rows': counts['processed'],
+        'success_count': counts['success'],
+        'updated_count': counts['updated'],
+        'unchanged_count': counts['unchanged'],
+        'duplicate_count': counts['duplicates'],
+        'error_count': counts['errors'],
+    }
+
+
+async def _heartbeat(job_id: str) -> None:
+    """
+    Marca o job como vivo enquanto ele espera a vez ou roda.
+    """
+    while True:
+        try:
+            await _update_job(job_id, heartbeat_at=func.now())
+        except Exception as e:
+            logger.warning(
+                'Falha ao atualizar heartbeat', job_id=job_id, error=str(e)
+            )
+        await asyncio.sleep(settings.IMPORT_JOB_HEARTBEAT_SECONDS)
+
+
+async def _run_job(job_id: str, path: Path) -> None:
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        async with _job_slots:
+            await _process_job(job_id, path)
+    finally:
+        heartbeat.cancel()
+
+
+async def _process_job(job_id: str, path: Path) -> None:
+    await _update_job(
+        job_id,
+        status=STATUS_RUNNING,
+        started_at=func.timezone('utc', func.now()),
+    )
+
+    async def on_progress(progress: dict) -> None:
+        await _update_job(
+            job_id,
+            processed_bytes=progress['byte_offset'],
+            **_counts_to_columns(progress),
+        )
+        ## Pausa entre lotes para ceder o loop às requisições da API
+        await asyncio.sleep(settings.IMPORT_BATCH_PAUSE)
+
+    try:
+        summary = await import_patients_from_csv(
+            str(path),
+            batch_size=settings.IMPORT_BATCH_SIZE,
+            force=True,
+            on_progress=on_progress,
+        )
+    except Exception as e:
+        logger.error('Falha na importação', job_id=job_id, error=str(e))
+        await _fail_job(job_id, str(e))
+        return
+
+    await _update_job(
+        job_id,
+        status=STATUS_COMPLETED,
+        processed_bytes=PatientImportJob.total_bytes,
+        finished_at=func.timezone('utc', func.now()),
+        **_counts_to_columns(summary),
+    )
+    path.unlink(missing_ok=True)
+
+
+async def _fail_job(job_id: str, error: str) -> None:
+    await _update_job(
+        job_id,
+        status=STATUS_FAILED,
+        error=error,
+        finished_at=func.timezone('utc', func.now()),
+    )
+    upload_path(job_id).unlink(missing_ok=True)
+
+
+def start_import_job(job_id: str, path: Path) -> None:
+    """
+    Agenda o processamento do arquivo em background neste worker.
+    """
+    task = asyncio.create_task(_run_job(job_id, path))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+
+
+async def recover_stale_jobs() -> list[str]:
+    """
+    Assume os jobs na fila ou rodando cujo heartbeat parou (o worker que
+    cuidava deles morreu) e os reinicia neste worker; a importação retoma
+    do último checkpoint. Sem o arquivo do upload, o job é dado como
+    falho.
+    """
+    stale_before = func.now() - timedelta(
+        seconds=settings.IMPORT_JOB_STALE_SECONDS
+    )
+    async with async_session() as session:
+        result = await session.exec(
+            update(PatientImportJob)
+            .where(
+                PatientImportJob.status.in_([STATUS_QUEUED, STATUS_RUNNING]),
+                PatientImportJob.heartbeat_at < stale_before,
+            )
+            .values(status=STATUS_QUEUED, heartbeat_at=func.now())
+            .returning(PatientImportJob.id)
+        )
+        job_ids = list(result.scalars().all())
+        await session.commit()
+
+    for job_id in job_ids:
+        path = upload_path(job_id)
+        if path.exists():
+            logger.warning('Retomando importação interrompida', job_id=job_id)
+            start_import_job(job_id, path)
+        else:
+            logger.error('Upload da importação não encontrado', job_id=job_id)
+            await _fail_job(job_id, 'Importação interrompida e upload perdido')
+    return job_ids
+
+
+async def watch_stale_jobs() -> None:
+    """
+    Roda recover_stale_jobs na subida do worker e periodicamente depois,
+    já que um worker reiniciado sobe antes do heartbeat do antigo vencer.
+    """
+    while True:
+        try:
+            await recover_stale_jobs()
+        except Exception as e:
+            logger.error('Falha ao recuperar importações', error=str(e))
+        await asyncio.sleep(settings.IMPORT_JOB_STALE_SECONDS / 2)
@@ -0,0 +1,236 @@
+from app.core.changes import OP_UPDATE, record_patient_changes
+from app.core.db import MAX_BIND_PARAMS, any_of
+from app.core.dedup import affects_matching, index_patients
+from fastapi import HTTPException
+from nuvie_db.nuvie.models.patient import Patient
+from datetime import datetime, timezone
+from sqlalchemy import DateTime, and_, column, func, not_, update, values
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Any, Iterable
+
+
+def _column(field: str):
+    if field not in Patient.__table__.columns:
+        raise HTTPException(status_code=400, detail=f'Campo inválido: {field}')
+    return Patient.__table__.columns[field]
+
+
+def _coerce(col, value):
+    """
+    O filtro chega como JSON: datas vêm como string ISO. Só aceita valores
+    escalares do tipo da coluna; o resto vira 400 em vez de erro no banco.
+    """
+    invalid = HTTPException(
+        status_code=400, detail=f'Valor inválido no filtro: {col.name}'
+    )
+    if isinstance(col.type, DateTime) and isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise invalid
+        if value.tzinfo:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    ## AutoString do SQLModel é um TypeDecorator: o tipo está no impl
+    try:
+        expected = getattr(col.type, 'impl', col.type).python_type
+    except NotImplementedError:
+        expected = object
+    if expected is float:
+        expected = (int, float)
+    if not isinstance(value, (str, int, float, datetime)):
+        raise invalid
+    if isinstance(value, bool) and expected is not bool:
+        raise invalid
+    if not isinstance(value, expected):
+        raise invalid
+    return value
+
+
+def _filter_condition(filters: dict[str, Any]):
+    """
+    Monta o WHERE a partir do filtro: igualdade, ou `= ANY` para listas
+    (um único parâmetro por lista, qualquer que seja o tamanho).
+    """
+    conditions = []
+    for field, value in filters.items():
+        col = _column(field)
+        if isinstance(value, list):
+            conditions.append(any_of(col, [_coerce(col, v) for v in value]))
+        elif value is None:
+            conditions.append(col.is_(None))
+        else:
+            conditions.append(col == _coerce(col, value))
+    return and_(*conditions)
+
+
+async def _execute(session: AsyncSession, statement):
+    """
+    Roda o UPDATE; uma violação de unicidade que passou pelas checagens
+    (escrita concorrente) vira 400 em vez de 500.
+    """
+    try:
+        return await session.exec(statement)
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=400,
+            detail='CPF/SSN já cadastrado para outro paciente',
+        )
+
+
+async def _apply_changes(
+    session: AsyncSession, result, fields: Iterable[str]
+) -> int:
+    patients = [Patient.model_validate(dict(row._mapping)) for row in result]
+    if affects_matching(fields):
+        await index_patients(session, patients)
+    await record_patient_changes(session, OP_UPDATE, patients)
+    return len(patients)
+
+
+async def bulk_update_by_filter(
+    session: AsyncSession, filters: dict[str, Any], patch: dict[str, Any]
+) -> int:
+    """
+    Aplica o mesmo patch a todos os pacientes que casam com o filtro,
+    num único UPDATE.
+    """
+    condition = _filter_condition(filters)
+    for field in patch:
+        _column(field)
+    if not patch:
+        return 0
+
+    if 'SSN' in patch:
+        matched = await session.exec(
+            select(func.count()).select_from(Patient).where(condition)
+        )
+        if matched.one() > 1:
+            raise HTTPException(
+                status_code=400,
+                detail='O mesmo CPF/SSN não pode ser atribuído a vários pacientes',
+            )
+        holder = await session.exec(
+            select(Patient.id).where(
+                Patient.SSN == patch['SSN'], not_(condition)
+            )
+        )
+        if holder.first():
+            raise HTTPException(
+                status_code=400,
+                detail='Já existe outro paciente cadastrado com este CPF/SSN',
+            )
+
+    result = await _execute(
+        session,
+        update(Patient)
+        .where(condition)
+        .values(patch)
+        .returning(*Patient.__table__.columns)
+        .execution_options(synchronize_session=False),
+    )
+    return await _apply_changes(session, result.all(), patch)
+
+
+async def _check_ssn_conflicts(
+    session: AsyncSession, patches: dict[str, dict[str, Any]]
+) -> None:
+    new_ssns = {
+        patient_id: patch['SSN']
+        for patient_id, patch in patches.items()
+        if patch.get('SSN')
+    }
+    if not new_ssns:
+        return
+
+    if len(set(new_ssns.values())) < len(new_ssns):
+        raise HTTPException(
+            status_code=400,
+            detail='O mesmo CPF/SSN não pode ser atribuído a vários pacientes',
+        )
+
+    ## O índice único é checado linha a linha e não é deferrable: um SSN
+    ## que ainda está com outro paciente, mesmo que ele esteja na lista
+    ## trocando o próprio (troca ou rodízio), falharia no meio do UPDATE.
+    receivers = {ssn: patient_id for patient_id, ssn in new_ssns.items()}
+    result = await session.exec(
+        select(Patient.id, Patient.SSN).where(any_of(Patient.SSN, receivers))
+    )
+    holders = [
+        (holder, ssn)
+        for holder, ssn in result.all()
+        if holder != receivers[ssn]
+    ]
+    swapped = [ssn for holder, ssn in holders if holder in new_ssns]
+    if swapped:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                'Troca de CPF/SSN entre pacientes da lista não é '
+                f'suportada: {", ".join(swapped)}'
+            ),
+        )
+    conflicts = [ssn for holder, ssn in holders]
+    if conflicts:
+        raise HTTPException(
+            status_code=400,
+            detail=f'CPF/SSN já cadastrado para outro paciente: {", ".join(conflicts)}',
+        )
+
+
+async def bulk_update_by_items(
+    session: AsyncSession, patches: dict[str, dict[str, Any]]
+) -> tuple[int, list[str]]:
+    """
+    Aplica um patch por paciente. Patches com o mesmo conjunto de campos
+    viram um único `UPDATE ... FROM (VALUES ...)`.
+    Retorna (quantidade atualizada, ids não encontrados).
+    """
+    await _check_ssn_conflicts(session, patches)
+
+    groups: dict[tuple[str, ...], list[tuple[str, dict]]] = {}
+    for patient_id, patch in patches.items():
+        if patch:
+            groups.setdefault(tuple(sorted(patch)), []).append(
+                (patient_id, patch)
+            )
+
+    updated_ids: set[str] = set()
+    id_column = Patient.__table__.columns['id']
+    for fields, entries in groups.items():
+        columns = [_column(field) for field in fields]
+        chunk_size = max(1, MAX_BIND_PARAMS // (len(fields) + 1))
+
+        for start in range(0, len(entries), chunk_size):
+            chunk = entries[start : start + chunk_size]
+            data = values(
+                column('id', id_column.type),
+                *(column(col.name, col.type) for col in columns),
+                name='patch_values',
+            ).data(
+                [
+                    (patient_id, *(patch[field] for field in fields))
+                    for patient_id, patch in chunk
+                ]
+            )
+            result = await _execute(
+                session,
+                update(Patient)
+                .where(id_column == data.c.id)
+                .values({col.name: data.c[col.name] for col in columns})
+                .returning(*Patient.__table__.columns)
+                .execution_options(synchronize_session=False),
+            )
+            rows = result.all()
+            updated_ids.update(row._mapping['id'] for row in rows)
+            await _apply_changes(session, rows, fields)
+
+    not_found = [
+        patient_id
+        for patient_id, patch in patches.items()
+        if patch and patient_id not in updated_ids
+    ]
+    return len(updated_ids), not_found
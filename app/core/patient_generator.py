@@ -0,0 +1,504 @@
+import csv
+import itertools
+import math
+import random
+import sys
+import uuid
+from collections import deque
+from datetime import date, timedelta
+from typing import Iterator, Optional
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+from nuvie_db.nuvie.models.patient import Patient
+
+from app.core.db import MAX_BIND_PARAMS, any_of, async_session
+from app.core.dedup import index_patients
+from app.core.logger import log as logger
+from app.core.patient_import import map_csv_to_patient
+
+## Mesmas colunas e ordem do scripts/client/patients.csv (formato Synthea).
+# fmt: off
+CSV_COLUMNS = [
+    'Id', 'BIRTHDATE', 'DEATHDATE', 'SSN', 'DRIVERS', 'PASSPORT',
+    'PREFIX', 'FIRST', 'MIDDLE', 'LAST', 'SUFFIX', 'MAIDEN', 'MARITAL',
+    'RACE', 'ETHNICITY', 'GENDER', 'BIRTHPLACE', 'ADDRESS', 'CITY',
+    'STATE', 'COUNTY', 'FIPS', 'ZIP', 'LAT', 'LON', 'HEALTHCARE_EXPENSES',
+    'HEALTHCARE_COVERAGE', 'INCOME',
+]
+
+MALE_NAMES = [
+    'James', 'Robert', 'John', 'Michael', 'David', 'William', 'Richard',
+    'Joseph', 'Thomas', 'Christopher', 'Charles', 'Daniel', 'Matthew',
+    'Anthony', 'Mark', 'Donald', 'Steven', 'Andrew', 'Paul', 'Joshua',
+    'Kenneth', 'Kevin', 'Brian', 'George', 'Timothy', 'Ronald', 'Jason',
+    'Edward', 'Jeffrey', 'Ryan', 'Jacob', 'Gary', 'Nicholas', 'Eric',
+    'Jonathan', 'Stephen', 'Larry', 'Justin', 'Scott', 'Brandon', 'Luis',
+    'Carlos', 'Jose', 'Wei', 'Mohammed',
+]
+
+FEMALE_NAMES = [
+    'Mary', 'Patricia', 'Jennifer', 'Linda', 'Elizabeth', 'Barbara',
+    'Susan', 'Jessica', 'Sarah', 'Karen', 'Lisa', 'Nancy', 'Betty',
+    'Sandra', 'Margaret', 'Ashley', 'Kimberly', 'Emily', 'Donna',
+    'Michelle', 'Carol', 'Amanda', 'Melissa', 'Deborah', 'Stephanie',
+    'Dorothy', 'Rebecca', 'Sharon', 'Laura', 'Cynthia', 'Amy', 'Kathleen',
+    'Angela', 'Shirley', 'Emma', 'Brenda', 'Pamela', 'Nicole', 'Anna',
+    'Samantha', 'Maria', 'Ana', 'Mei', 'Fatima', 'Olivia',
+]
+
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+    'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez',
+    'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark',
+    'Ramirez', 'Lewis', 'Robinson', 'Walker', 'Young', 'Allen', 'King',
+    'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores', 'Green',
+    'Adams', 'Nelson', 'Baker', 'Hall', 'Rivera', 'Campbell', 'Mitchell',
+    'Carter', 'Roberts', 'Heathcote', 'Dickens', 'Lang', 'Sipes', 'Orn',
+    'Quigley', 'Dibbert', 'Kovacek', 'Schmitt', 'Oconnor', 'Chen', 'Patel',
+]
+
+STREET_NAMES = [
+    'Main', 'Oak', 'Pine', 'Maple', 'Cedar', 'Elm', 'Washington', 'Lake',
+    'Hill', 'Park', 'Jacobs', 'Quigley', 'Dibbert', 'Lincoln', 'Jackson',
+    'Church', 'Highland', 'Franklin', 'Sunset', 'Ridge', 'Walnut',
+    'Chestnut', 'River', 'Spring', 'Adams', 'Madison', 'Cherry', 'Willow',
+]
+
+STREET_SUFFIXES = {
+    'Street': 'St',
+    'Avenue': 'Ave',
+    'Road': 'Rd',
+    'Lane': 'Ln',
+    'Drive': 'Dr',
+    'Court': 'Ct',
+    'Boulevard': 'Blvd',
+    'Way': 'Way',
+    'Corner': 'Cor',
+    'Branch': 'Br',
+}
+
+## (cidade, estado, condado, FIPS, ZIP base, lat, lon, população em mil)
+CITIES = [
+    ('Boston', 'Massachusetts', 'Suffolk County', '25025', '02108', 42.3601, -71.0589, 675),
+    ('Cambridge', 'Massachusetts', 'Middlesex County', '25017', '02139', 42.3736, -71.1097, 118),
+    ('Worcester', 'Massachusetts', 'Worcester County', '25027', '01608', 42.2626, -71.8023, 206),
+    ('Springfield', 'Massachusetts', 'Hampden County', '25013', '01103', 42.1015, -72.5898, 155),
+    ('New York', 'New York', 'New York County', '36061', '10001', 40.7128, -74.0060, 1630),
+    ('Brooklyn', 'New York', 'Kings County', '36047', '11201', 40.6782, -73.9442, 2560),
+    ('Buffalo', 'New York', 'Erie County', '36029', '14201', 42.8864, -78.8784, 278),
+    ('Los Angeles', 'California', 'Los Angeles County', '06037', '90012', 34.0522, -118.2437, 3820),
+    ('San Diego', 'California', 'San Diego County', '06073', '92101', 32.7157, -117.1611, 1380),
+    ('San Francisco', 'California', 'San Francisco County', '06075', '94102', 37.7749, -122.4194, 808),
+    ('Fresno', 'California', 'Fresno County', '06019', '93721', 36.7378, -119.7871, 545),
+    ('Houston', 'Texas', 'Harris County', '48201', '77002', 29.7604, -95.3698, 2300),
+    ('Dallas', 'Texas', 'Dallas County', '48113', '75201', 32.7767, -96.7970, 1300),
+    ('San Antonio', 'Texas', 'Bexar County', '48029', '78205', 29.4241, -98.4936, 1450),
+    ('Austin', 'Texas', 'Travis County', '48453', '78701', 30.2672, -97.7431, 975),
+    ('Miami', 'Florida', 'Miami-Dade County', '12086', '33130', 25.7617, -80.1918, 450),
+    ('Orlando', 'Florida', 'Orange County', '12095', '32801', 28.5383, -81.3792, 310),
+    ('Tampa', 'Florida', 'Hillsborough County', '12057', '33602', 27.9506, -82.4572, 400),
+    ('Chicago', 'Illinois', 'Cook County', '17031', '60601', 41.8781, -87.6298, 2700),
+    ('Philadelphia', 'Pennsylvania', 'Philadelphia County', '42101', '19103', 39.9526, -75.1652, 1580),
+    ('Pittsburgh', 'Pennsylvania', 'Allegheny County', '42003', '15222', 40.4406, -79.9959, 300),
+    ('Columbus', 'Ohio', 'Franklin County', '39049', '43215', 39.9612, -82.9988, 905),
+    ('Cleveland', 'Ohio', 'Cuyahoga County', '39035', '44113', 41.4993, -81.6944, 370),
+    ('Atlanta', 'Georgia', 'Fulton County', '13121', '30303', 33.7490, -84.3880, 500),
+    ('Charlotte', 'North Carolina', 'Mecklenburg County', '37119', '28202', 35.2271, -80.8431, 875),
+    ('Detroit', 'Michigan', 'Wayne County', '26163', '48226', 42.3314, -83.0458, 630),
+    ('Seattle', 'Washington', 'King County', '53033', '98101', 47.6062, -122.3321, 740),
+    ('Phoenix', 'Arizona', 'Maricopa County', '04013', '85004', 33.4484, -112.0740, 1610),
+    ('Denver', 'Colorado', 'Denver County', '08031', '80202', 39.7392, -104.9903, 715),
+    ('Nashville', 'Tennessee', 'Davidson County', '47037', '37203', 36.1627, -86.7816, 690),
+]
+
+## Pirâmide etária (faixas de 5 anos, % da população)
+AGE_BRACKETS = [
+    6.0, 6.1, 6.4, 6.4, 6.6, 7.0, 6.9, 6.6, 6.2, 6.1,
+    6.3, 6.5, 6.3, 5.4, 4.4, 3.0, 1.9, 1.2, 0.5, 0.1,
+]
+# fmt: on
+
+RACES = ['white', 'black', 'asian', 'native', 'hawaiian', 'other']
+RACE_WEIGHTS = [62.0, 13.0, 6.0, 1.0, 0.5, 17.5]
+
+## Estado civil por faixa etária: (idade mínima, pesos de S, M, D, W)
+MARITAL_BY_AGE = [
+    (65, [8, 50, 14, 28]),
+    (40, [20, 58, 17, 5]),
+    (25, [45, 45, 9, 1]),
+    (18, [90, 9, 1, 0]),
+]
+
+## SSNs na faixa 900-999, que nunca é emitida: os dados gerados não
+## colidem com SSNs reais.
+SSN_SPACE = 100 * 99 * 9999
+
+
+def _zipf_weights(size: int, exponent: float = 1.0) -> list[float]:
+    """
+    Pesos cumulativos de uma Zipf: poucos nomes muito comuns e cauda longa.
+    """
+    return list(
+        itertools.accumulate(
+            1 / (rank**exponent) for rank in range(1, size + 1)
+        )
+    )
+
+
+class PatientGenerator:
+    """
+    Gera linhas no formato do patients.csv com distribuições realistas.
+
+    Tudo sai de um único random.Random(seed): a mesma seed gera exatamente
+    o mesmo arquivo. Uma fração `duplicate_rate` das linhas é uma cópia
+    alterada (erros de digitação, endereço abreviado, data trocada, SSN
+    com erro ou novo) de um paciente gerado antes, para exercitar a
+    deduplicação.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        duplicate_rate: float = 0.0,
+        reference_date: date = date(2025, 1, 1),
+        duplicate_window: int = 20000,
+    ):
+        if not 0 <= duplicate_rate < 1:
+            raise ValueError('duplicate_rate deve estar em [0, 1)')
+        self.rng = random.Random(seed)
+        self.duplicate_rate = duplicate_rate
+        self.reference_date = reference_date
+        ## Só os últimos originais ficam em memória, para gerar em streaming
+        self.recent: deque[dict] = deque(maxlen=duplicate_window)
+        self.generated = 0
+
+        self._male_weights = _zipf_weights(len(MALE_NAMES))
+        self._female_weights = _zipf_weights(len(FEMALE_NAMES))
+        self._last_weights = _zipf_weights(len(LAST_NAMES), 0.8)
+        self._street_weights = _zipf_weights(len(STREET_NAMES), 0.5)
+        self._city_weights = list(itertools.accumulate(c[7] for c in CITIES))
+        self._age_weights = list(itertools.accumulate(AGE_BRACKETS))
+        self._race_weights = list(itertools.accumulate(RACE_WEIGHTS))
+
+        ## Permutação a*i + b (mod SSN_SPACE): SSNs únicos sem guardar nada
+        self._ssn_a = self.rng.randrange(SSN_SPACE // 2, SSN_SPACE)
+        while math.gcd(self._ssn_a, SSN_SPACE) != 1:
+            self._ssn_a += 1
+        self._ssn_b = self.rng.randrange(SSN_SPACE)
+
+    def _ssn(self) -> str:
+        if self.generated >= SSN_SPACE:
+            raise ValueError('Limite de SSNs únicos atingido')
+        index = (self._ssn_a * self.generated + self._ssn_b) % SSN_SPACE
+        index, serial = divmod(index, 9999)
+        area, group = divmod(index, 99)
+        return f'{900 + area}-{group + 1:02d}-{serial + 1:04d}'
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _pick(self, values, cum_weights):
+        return self.rng.choices(values, cum_weights=cum_weights)[0]
+
+    def _birth_date(self) -> tuple[date, int]:
+        bracket = self._pick(range(len(AGE_BRACKETS)), self._age_weights)
+        age = bracket * 5 + self.rng.randrange(5)
+        days = age * 365 + self.rng.randrange(365)
+        return self.reference_date - timedelta(days=days), age
+
+    def _death_date(self, birth_date: date, age: int) -> Optional[date]:
+        ## Mortalidade de Gompertz: cresce exponencialmente com a idade
+        if self.rng.random() >= min(0.9, 0.00005 * math.exp(0.095 * age)):
+            return None
+        lived = (self.reference_date - birth_date).days
+        return self.reference_date - timedelta(
+            days=self.rng.randrange(min(lived, 3650) or 1)
+        )
+
+    def _marital(self, age: int) -> str:
+        for min_age, weights in MARITAL_BY_AGE:
+            if age >= min_age:
+                return self.rng.choices('SMDW', weights=weights)[0]
+        return ''
+
+    def _address(self) -> str:
+        street = self._pick(STREET_NAMES, self._street_weights)
+        suffix = self.rng.choice(list(STREET_SUFFIXES))
+        address = f'{self.rng.randint(1, 9999)} {street} {suffix}'
+        if self.rng.random() < 0.15:
+            address += f' Suite {self.rng.randint(1, 99)}'
+        return address
+
+    def _location(self) -> dict:
+        city, state, county, fips, zip_code, lat, lon, _ = self._pick(
+            CITIES, self._city_weights
+        )
+        return {
+            'CITY': city,
+            'STATE': state,
+            'COUNTY': county,
+            'FIPS': fips,
+            'ZIP': f'{int(zip_code) + self.rng.randrange(10):05d}',
+            'LAT': repr(lat + self.rng.gauss(0, 0.05)),
+            'LON': repr(lon + self.rng.gauss(0, 0.05)),
+        }
+
+    def _original(self) -> dict:
+        rng = self.rng
+        gender = 'M' if rng.random() < 0.49 else 'F'
+        if gender == 'M':
+            first = self._pick(MALE_NAMES, self._male_weights)
+            middle = self._pick(MALE_NAMES, self._male_weights)
+        else:
+            first = self._pick(FEMALE_NAMES, self._female_weights)
+            middle = self._pick(FEMALE_NAMES, self._female_weights)
+        last = self._pick(LAST_NAMES, self._last_weights)
+
+        birth_date, age = self._birth_date()
+        death_date = self._death_date(birth_date, age)
+        marital = self._marital(age)
+        if age < 18:
+            prefix = ''
+        elif gender == 'M':
+            prefix = 'Mr.'
+        else:
+            prefix = 'Mrs.' if marital in ('M', 'W') else 'Ms.'
+        maiden = ''
+        if gender == 'F' and marital in ('M', 'D', 'W'):
+            maiden = self._pick(LAST_NAMES, self._last_weights)
+
+        birthplace = self._pick(CITIES, self._city_weights)
+        expenses = (age + 1) * rng.lognormvariate(math.log(2500), 0.6)
+        coverage = expenses * rng.lognormvariate(0, 0.8)
+
+        return {
+            'Id': self._uuid(),
+            'BIRTHDATE': birth_date.isoformat(),
+            'DEATHDATE': death_date.isoformat() if death_date else '',
+            'SSN': self._ssn(),
+            'DRIVERS': f'S99{rng.randrange(10**6):06d}' if age >= 16 else '',
+            'PASSPORT': (
+                f'X{rng.randrange(10**8):08d}X'
+                if age >= 18 and rng.random() < 0.6
+                else ''
+            ),
+            'PREFIX': prefix,
+            'FIRST': first,
+            'MIDDLE': middle if rng.random() < 0.7 else '',
+            'LAST': last,
+            'SUFFIX': 'Jr.' if gender == 'M' and rng.random() < 0.01 else '',
+            'MAIDEN': maiden,
+            'MARITAL': marital,
+            'RACE': self._pick(RACES, self._race_weights),
+            'ETHNICITY': 'hispanic' if rng.random() < 0.19 else 'nonhispanic',
+            'GENDER': gender,
+            'BIRTHPLACE': f'{birthplace[0]}  {birthplace[1]}  US',
+            'ADDRESS': self._address(),
+            **self._location(),
+            'HEALTHCARE_EXPENSES': f'{expenses:.2f}',
+            'HEALTHCARE_COVERAGE': f'{coverage:.2f}',
+            'INCOME': str(int(rng.lognormvariate(math.log(55000), 0.75))),
+        }
+
+    def _typo(self, value: str) -> str:
+        if len(value) < 3:
+            return value
+        i = self.rng.randrange(1, len(value) - 1)
+        kind = self.rng.randrange(3)
+        if kind == 0:
+            return value[:i] + value[i + 1] + value[i] + value[i + 2 :]
+        if kind == 1:
+            return value[:i] + value[i + 1 :]
+        return value[:i] + value[i] + value[i:]
+
+    def _duplicate_ssn(self, ssn: str) -> str:
+        """
+        SSN do recadastro. O mesmo SSN não entra (é único no banco e o
+        importador pula), então ele vem com um dígito errado, sem os traços
+        ou é outro SSN.
+        """
+        kind = self.rng.random()
+        if kind < 0.4:
+            digits = [i for i, c in enumerate(ssn) if c.isdigit()][3:]
+            i = self.rng.choice(digits)
+            digit = self.rng.choice([d for d in '0123456789' if d != ssn[i]])
+            return ssn[:i] + digit + ssn[i + 1 :]
+        if kind < 0.7:
+            return ssn.replace('-', '')
+        return self._ssn()
+
+    def _duplicate(self, original: dict) -> dict:
+        """
+        Mesmo paciente recadastrado: Id novo, SSN alterado e de 1 a 3
+        alterações típicas de digitação.
+        """
+        row = {
+            **original,
+            'Id': self._uuid(),
+            'SSN': self._duplicate_ssn(original['SSN']),
+        }
+        changes = self.rng.sample(range(6), self.rng.randint(1, 3))
+        for change in changes:
+            if change == 0:
+                row['FIRST'] = self._typo(row['FIRST'])
+            elif change == 1:
+                row['LAST'] = self._typo(row['LAST'])
+            elif change == 2:
+                row['MIDDLE'] = row['MIDDLE'][:1]
+            elif change == 3:
+                for full, short in STREET_SUFFIXES.items():
+                    row['ADDRESS'] = row['ADDRESS'].replace(full, short)
+            elif change == 4:
+                year, month, day = row['BIRTHDATE'].split('-')
+                if int(day) <= 12 and day != month:
+                    row['BIRTHDATE'] = f'{year}-{day}-{month}'
+                else:
+                    row['BIRTHDATE'] = (
+                        date.fromisoformat(row['BIRTHDATE'])
+                        + timedelta(days=1)
+                    ).isoformat()
+            else:
+                row['ADDRESS'] = self._address()
+                row.update(self._location())
+        return row
+
+    def rows(self, count: int) -> Iterator[tuple[dict, Optional[str]]]:
+        """
+        Gera `count` linhas em streaming.
+        Cada item é (linha, Id do original) para duplicatas ou (linha, None).
+        """
+        for _ in range(count):
+            if self.recent and self.rng.random() < self.duplicate_rate:
+                original = self.rng.choice(self.recent)
+                row = self._duplicate(original)
+                original_id = original['Id']
+            else:
+                row = self._original()
+                self.recent.append(row)
+                original_id = None
+            self.generated += 1
+            yield row, original_id
+
+
+def write_patients_csv(
+    path: str,
+    count: int,
+    seed: int = 0,
+    duplicate_rate: float = 0.0,
+    truth_path: str | None = None,
+) -> dict:
+    """
+    Escreve `count` pacientes em CSV (`-` para stdout), linha a linha.
+    Com `truth_path`, grava também os pares (duplicata, original) gerados,
+    para medir precisão e recall da deduplicação.
+    """
+    generator = PatientGenerator(seed=seed, duplicate_rate=duplicate_rate)
+    output = sys.stdout if path == '-' else open(path, 'w', newline='')
+    truth = open(truth_path, 'w', newline='') if truth_path else None
+    duplicates = 0
+    try:
+        writer = csv.DictWriter(output, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        truth_writer = csv.writer(truth) if truth else None
+        if truth_writer:
+            truth_writer.writerow(['duplicate_id', 'original_id'])
+
+        for row, original_id in generator.rows(count):
+            writer.writerow(row)
+            if original_id:
+                duplicates += 1
+                if truth_writer:
+                    truth_writer.writerow([row['Id'], original_id])
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if truth:
+            truth.close()
+
+    return {'rows': count, 'duplicates': duplicates}
+
+
+async def _not_seeded(session, values: list[dict]) -> list[dict]:
+    """
+    Tira do lote os pacientes cujo id ou SSN já está no banco ou aparece
+    antes no próprio lote. Com a tabela particionada por estado não há PK
+    em id, e o ON CONFLICT não tem o que absorver: o trigger do locator
+    levantaria IntegrityError.
+    """
+    ids = [v['id'] for v in values]
+    ssns = [v['SSN'] for v in values if v['SSN']]
+    result = await session.exec(
+        select(Patient.id, Patient.SSN).where(
+            or_(
+                any_of(Patient.id, ids),
+                any_of(Patient.SSN, ssns),
+            )
+        )
+    )
+    seen = set()
+    for patient_id, ssn in result.all():
+        seen.update({patient_id, ssn})
+
+    fresh = []
+    for v in values:
+        if v['id'] in seen or (v['SSN'] and v['SSN'] in seen):
+            continue
+        seen.update({v['id'], v['SSN']})
+        fresh.append(v)
+    return fresh
+
+
+async def seed_patients_db(
+    count: int,
+    seed: int = 0,
+    duplicate_rate: float = 0.0,
+    batch_size: int = 1000,
+    index: bool = False,
+) -> dict:
+    """
+    Insere os pacientes gerados direto no banco, sem passar por CSV.
+
+    Usa o mesmo mapeamento do importador e INSERT em lote com
+    ON CONFLICT DO NOTHING, pulando antes os ids e SSNs que já existem:
+    como os Ids saem da seed, rodar de novo não duplica nada. Não grava
+    no feed de alterações; o índice de duplicados só é atualizado com
+    `index` (senão, rodar find_duplicates).
+    """
+    generator = PatientGenerator(seed=seed, duplicate_rate=duplicate_rate)
+    rows = generator.rows(count)
+    inserted = 0
+
+    ## Um INSERT por fatia do lote, abaixo do limite de parâmetros
+    rows_per_insert = MAX_BIND_PARAMS // len(Patient.__table__.columns)
+    while batch := list(itertools.islice(rows, batch_size)):
+        values = [
+            {'id': row['Id'], **map_csv_to_patient(row).model_dump()}
+            for row, _ in batch
+        ]
+        async with async_session() as session:
+            values = await _not_seeded(session, values)
+            new_ids = set()
+            for start in range(0, len(values), rows_per_insert):
+                result = await session.exec(
+                    insert(Patient)
+                    .values(values[start : start + rows_per_insert])
+                    .on_conflict_do_nothing()
+                    .returning(Patient.id)
+                )
+                new_ids.update(result.scalars().all())
+            if index and new_ids:
+                await index_patients(
+                    session,
+                    [Patient(**v) for v in values if v['id'] in new_ids],
+                )
+            await session.commit()
+
+        inserted += len(new_ids)
+        logger.info(
+            'Pacientes sintéticos inseridos',
+            generated=generator.generated,
+            inserted=inserted,
+        )
+
+    return {'rows': generator.generated, 'inserted': inserted}
@@ -0,0 +1,510 @@
+import anyio
+import csv
+import hashlib
+import os
+import uuid
+import pandas as pd
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select
+from nuvie_db.nuvie.models.patient import Patient, PatientCreate
+
+from app.core.changes import OP_CREATE, OP_UPDATE, record_patient_changes
+from app.core.db import async_session
+from app.core.dedup import affects_matching, index_patients
+from app.core.logger import log as logger
+from app.models.patient_import import (
+    PatientImportCheckpoint,
+    PatientImportRowHash,
+)
+
+
+def parse_date(date_str: str) -> Optional[datetime]:
+    """
+    Converte string de data para datetime.
+    Assume formato YYYY-MM-DD ou similar.
+    """
+    if not date_str or pd.isna(date_str) or date_str.strip() == '':
+        return None
+
+    try:
+        formats = ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S']
+
+        for fmt in formats:
+            try:
+                return datetime.strptime(str(date_str).strip(), fmt)
+            except ValueError:
+                continue
+
+        return pd.to_datetime(date_str)
+
+    except Exception as e:
+        logger.warning(f"Erro ao converter data '{date_str}': {e}")
+        return None
+
+
+def clean_string(value) -> Optional[str]:
+    """
+    Limpa e valida strings.
+    """
+    if pd.isna(value) or value == '' or str(value).strip() == '':
+        return None
+    return str(value).strip()
+
+
+def clean_float(value) -> Optional[float]:
+    """
+    Limpa e valida valores float.
+    """
+    if pd.isna(value) or value == '' or str(value).strip() == '':
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def map_csv_to_patient(row) -> PatientCreate:
+    """
+    Mapeia uma linha do CSV para um objeto PatientCreate.
+    """
+    first_name = clean_string(row.get('FIRST', ''))
+    middle_name = clean_string(row.get('MIDDLE', ''))
+    last_name = clean_string(row.get('LAST', ''))
+    prefix = clean_string(row.get('PREFIX', ''))
+    suffix = clean_string(row.get('SUFFIX', ''))
+
+    name_parts = []
+    if prefix:
+        name_parts.append(prefix)
+    if first_name:
+        name_parts.append(first_name)
+    if middle_name:
+        name_parts.append(middle_name)
+    if last_name:
+        name_parts.append(last_name)
+    if suffix:
+        name_parts.append(suffix)
+
+    full_name = ' '.join(name_parts) if name_parts else None
+
+    marital_mapping = {
+        'S': 'Solteiro',
+        'M': 'Casado',
+        'D': 'Divorciado',
+        'W': 'Viúvo',
+        'SINGLE': 'Solteiro',
+        'MARRIED': 'Casado',
+        'DIVORCED': 'Divorciado',
+        'WIDOWED': 'Viúvo',
+    }
+
+    marital_status = clean_string(row.get('MARITAL'))
+    civil_state = None
+    if marital_status:
+        civil_state = marital_mapping.get(
+            marital_status.upper(), marital_status
+        )
+
+    gender_mapping = {
+        'M': 'Masculino',
+        'F': 'Feminino',
+        'MALE': 'Masculino',
+        'FEMALE': 'Feminino',
+    }
+
+    gender_raw = clean_string(row.get('GENDER'))
+    gender = None
+    if gender_raw:
+        gender = gender_mapping.get(gender_raw.upper(), gender_raw)
+
+    race_mapping = {
+        'WHITE': 'Branco',
+        'BLACK': 'Preto',
+        'HISPANIC': 'Pardo',
+        'ASIAN': 'Amarelo',
+        'NATIVE': 'Indígena',
+        'OTHER': 'Outro',
+    }
+
+    race_raw = clean_string(row.get('RACE'))
+    race = None
+    if race_raw:
+        race = race_mapping.get(race_raw.upper(), race_raw)
+
+    return PatientCreate(
+        birth_date=parse_date(row.get('BIRTHDATE')),
+        death_date=parse_date(row.get('DEATHDATE')),
+        SSN=clean_string(row.get('SSN')),
+        full_name=full_name,
+        gender=gender,
+        self_declared_color=race,
+        civil_state=civil_state,
+        income=clean_float(row.get('INCOME')),
+        address=clean_string(row.get('ADDRESS')),
+        city=clean_string(row.get('CITY')),
+        state=clean_string(row.get('STATE')),
+        zip_code=clean_string(row.get('ZIP')),
+        healthcare_coverage=clean_string(row.get('HEALTHCARE_COVERAGE')),
+    )
+
+
+def file_sha256(csv_file_path: str) -> str:
+    """
+    Hash do arquivo inteiro, usado como chave do checkpoint.
+    """
+    digest = hashlib.sha256()
+    with open(csv_file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_content_hash(values: list[str]) -> str:
+    """
+    Hash do conteúdo bruto de uma linha do CSV.
+    """
+    return hashlib.sha256('\x1f'.join(values).encode()).hexdigest()
+
+
+def iter_csv_rows(csv_file_path: str, byte_offset: int = 0):
+    """
+    Lê o CSV em streaming a partir de `byte_offset`.
+    Gera (offset em bytes logo após a linha, valores, dict da linha).
+    """
+    with open(csv_file_path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+        if byte_offset:
+            f.seek(byte_offset)
+
+        def lines():
+            while line := f.readline():
+                yield line.decode('utf-8')
+
+        for values in csv.reader(lines()):
+            if not values:
+                continue
+            yield f.tell(), values, dict(zip(header, values))
+
+
+async def forget_row_hashes(session, patient_ids: list[str]) -> None:
+    """
+    Apaga o hash de linha dos pacientes removidos.
+    """
+    if patient_ids:
+        await session.exec(
+            delete(PatientImportRowHash).where(
+                PatientImportRowHash.patient_id.in_(patient_ids)
+            )
+        )
+
+
+async def _import_batch(session, rows: list, counts: dict) -> None:
+    """
+    Importa um lote de linhas na sessão dada, sem commitar.
+    Busca SSNs, pacientes e hashes do lote em poucas queries em vez de
+    uma consulta por linha.
+    """
+    valid_rows = []
+    for row_number, values, row in rows:
+        if not clean_string(row.get('SSN')) or not clean_string(
+            row.get('BIRTHDATE')
+        ):
+            logger.warning(
+                f'Linha {row_number}: SSN ou BIRTHDATE ausente, pulando...'
+            )
+            counts['errors'] += 1
+            continue
+        patient_id = clean_string(row.get('Id')) or str(uuid.uuid4())
+        valid_rows.append(
+            (row_number, patient_id, row_content_hash(values), row)
+        )
+
+    if not valid_rows:
+        return
+
+    patient_ids = [patient_id for _, patient_id, _, _ in valid_rows]
+    ssns = [clean_string(row.get('SSN')) for _, _, _, row in valid_rows]
+
+    result = await session.exec(
+        select(PatientImportRowHash).where(
+            PatientImportRowHash.patient_id.in_(patient_ids)
+        )
+    )
+    known_hashes = {r.patient_id: r.content_hash for r in result.all()}
+
+    result = await session.exec(
+        select(Patient).where(Patient.id.in_(patient_ids))
+    )
+    existing_by_id = {p.id: p for p in result.all()}
+
+    result = await session.exec(
+        select(Patient.SSN, Patient.id).where(Patient.SSN.in_(ssns))
+    )
+    id_by_ssn = {ssn: patient_id for ssn, patient_id in result.all()}
+
+    created, updated, new_hashes = [], {}, {}
+    rematched = {}
+    for row_number, patient_id, content_hash, row in valid_rows:
+        try:
+            ## O hash só vale enquanto o paciente existir: uma linha igual
+            ## de um paciente apagado precisa recriá-lo.
+            if (
+                known_hashes.get(patient_id) == content_hash
+                and patient_id in existing_by_id
+            ):
+                counts['unchanged'] += 1
+                continue
+
+            patient_data = map_csv_to_patient(row)
+            owner = id_by_ssn.get(patient_data.SSN)
+            if owner is not None and owner != patient_id:
+                logger.info(
+                    f'Linha {row_number}: Paciente com SSN {patient_data.SSN} já existe, pulando...'
+                )
+                counts['duplicates'] += 1
+                continue
+
+            db_patient = existing_by_id.get(patient_id)
+            if db_patient is None:
+                db_patient = Patient(
+                    id=patient_id, **patient_data.model_dump()
+                )
+                existing_by_id[patient_id] = db_patient
+                created.append(db_patient)
+                counts['success'] += 1
+            else:
+                changed = []
+                for field, value in patient_data.model_dump().items():
+                    if getattr(db_patient, field) != value:
+                        changed.append(field)
+                    setattr(db_patient, field, value)
+                if db_patient not in created:
+                    updated[patient_id] = db_patient
+                    if affects_matching(changed):
+                        rematched[patient_id] = db_patient
+                counts['updated'] += 1
+
+            session.add(db_patient)
+            id_by_ssn[patient_data.SSN] = patient_id
+            new_hashes[patient_id] = content_hash
+
+        except Exception as e:
+            logger.error(f'Erro ao processar linha {row_number}: {e}')
+            counts['errors'] += 1
+
+    await index_patients(session, [*created, *rematched.values()])
+
+    if new_hashes:
+        statement = insert(PatientImportRowHash).values(
+            [
+                {'patient_id': k, 'content_hash': v}
+                for k, v in new_hashes.items()
+            ]
+        )
+        await session.exec(
+            statement.on_conflict_do_update(
+                index_elements=[PatientImportRowHash.patient_id],
+                set_={'content_hash': statement.excluded.content_hash},
+            )
+        )
+
+    await record_patient_changes(session, OP_CREATE, created)
+    await record_patient_changes(session, OP_UPDATE, updated.values())
+
+
+async def _save_checkpoint(
+    session,
+    file_hash: str,
+    byte_offset: int,
+    row_offset: int,
+    counts: dict,
+    completed: bool = False,
+) -> None:
+    statement = insert(PatientImportCheckpoint).values(
+        file_hash=file_hash,
+        byte_offset=byte_offset,
+        row_offset=row_offset,
+        counts=counts,
+        completed=completed,
+    )
+    await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[PatientImportCheckpoint.file_hash],
+            set_={
+                'byte_offset': statement.excluded.byte_offset,
+                'row_offset': statement.excluded.row_offset,
+                'counts': statement.excluded.counts,
+                'completed': statement.excluded.completed,
+                'updated_at': func.now(),
+            },
+        )
+    )
+
+
+async def _commit_batch(
+    file_hash: str, batch: list, row_offset: int, counts: dict
+) -> None:
+    """
+    Commita o lote junto com o checkpoint, que leva os contadores
+    acumulados. Se o lote falhar, refaz linha a linha para isolar a linha
+    problemática e só então avança o checkpoint.
+    """
+    byte_offset = batch[-1][1]
+    rows = [(row_number, values, row) for row_number, _, values, row in batch]
+
+    try:
+        async with async_session() as session:
+            batch_counts = dict.fromkeys(counts, 0)
+            await _import_batch(session, rows, batch_counts)
+            await _save_checkpoint(
+                session,
+                file_hash,
+                byte_offset,
+                row_offset,
+                {key: counts[key] + batch_counts[key] for key in counts},
+            )
+            await session.commit()
+        for key, value in batch_counts.items():
+            counts[key] += value
+        logger.info('Lote commitado com sucesso')
+        return
+    except Exception as e:
+        logger.error(
+            f'Erro ao commitar lote, reprocessando linha a linha: {e}'
+        )
+
+    for single in rows:
+        try:
+            async with async_session() as session:
+                row_counts = dict.fromkeys(counts, 0)
+                await _import_batch(session, [single], row_counts)
+                await session.commit()
+            for key, value in row_counts.items():
+                counts[key] += value
+        except Exception as e:
+            logger.error(f'Erro ao processar linha {single[0]}: {e}')
+            counts['errors'] += 1
+
+    async with async_session() as session:
+        await _save_checkpoint(
+            session, file_hash, byte_offset, row_offset, counts
+        )
+        await session.commit()
+
+
+async def import_patients_from_csv(
+    csv_file_path: str,
+    batch_size: int = 100,
+    force: bool = False,
+    on_progress: Callable[[dict], Awaitable[None]] | None = None,
+) -> dict:
+    """
+    Importa pacientes do CSV para o banco de dados.
+
+    O progresso é salvo por lote (hash do arquivo + offset em bytes/linhas),
+    então uma importação interrompida retoma de onde parou. Cada linha tem
+    o hash do conteúdo guardado: reimportações só atualizam as linhas que
+    mudaram na origem.
+
+    `on_progress`, se informado, é chamado após cada lote com o offset em
+    bytes, o tamanho do arquivo e os contadores acumulados; numa retomada
+    eles partem dos totais gravados no checkpoint.
+    """
+    try:
+        logger.info(f'Lendo arquivo CSV: {csv_file_path}')
+        total_bytes = os.path.getsize(csv_file_path)
+        file_hash = await anyio.to_thread.run_sync(file_sha256, csv_file_path)
+
+        async with async_session() as session:
+            checkpoint = await session.get(PatientImportCheckpoint, file_hash)
+
+        counts = {
+            'success': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'errors': 0,
+            'duplicates': 0,
+        }
+        processed = 0
+
+        byte_offset, row_offset = 0, 0
+        if checkpoint and checkpoint.completed and not force:
+            logger.info(
+                f'Arquivo já importado por completo ({file_hash[:12]}), nada a fazer'
+            )
+            return {'processed': processed, **counts}
+        if checkpoint and not checkpoint.completed:
+            byte_offset, row_offset = (
+                checkpoint.byte_offset,
+                checkpoint.row_offset,
+            )
+            processed = row_offset
+            for key, value in (checkpoint.counts or {}).items():
+                if key in counts:
+                    counts[key] = value
+            logger.info(
+                f'Retomando importação a partir da linha {row_offset + 1}'
+            )
+        batch = []
+
+        for end_offset, values, row in iter_csv_rows(
+            csv_file_path, byte_offset
+        ):
+            row_offset += 1
+            processed += 1
+            byte_offset = end_offset
+            batch.append((row_offset, end_offset, values, row))
+
+            if len(batch) >= batch_size:
+                logger.info(
+                    f'Processando lote: linhas {batch[0][0]} a {batch[-1][0]}'
+                )
+                await _commit_batch(file_hash, batch, row_offset, counts)
+                batch = []
+                if on_progress:
+                    await on_progress(
+                        {
+                            'processed': processed,
+                            'byte_offset': byte_offset,
+                            'total_bytes': total_bytes,
+                            **counts,
+                        }
+                    )
+
+        if batch:
+            logger.info(
+                f'Processando lote: linhas {batch[0][0]} a {batch[-1][0]}'
+            )
+            await _commit_batch(file_hash, batch, row_offset, counts)
+
+        async with async_session() as session:
+            await _save_checkpoint(
+                session,
+                file_hash,
+                byte_offset,
+                row_offset,
+                counts,
+                completed=True,
+            )
+            await session.commit()
+
+        logger.info(
+            f"""
+        === RESUMO DA IMPORTAÇÃO ===
+        Total de registros processados: {processed}
+        Sucessos: {counts['success']}
+        Atualizados: {counts['updated']}
+        Inalterados (pulados): {counts['unchanged']}
+        Erros: {counts['errors']}
+        Duplicados (pulados): {counts['duplicates']}
+        ===========================
+        """
+        )
+        return {'processed': processed, **counts}
+
+    except Exception as e:
+        logger.error(f'Erro geral na importação: {e}')
+        raise
@@ -0,0 +1,530 @@
+import anyio
+import re
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from nuvie_db.nuvie.models.patient import Patient
+
+from app.core.db import async_session
+from app.core.logger import log as logger
+from app.models.patient_partition import PatientLocator
+
+## Migração online da tabela de pacientes para um layout particionado:
+##
+## 1. prepare: cria <patient>_partitioned (hash por id ou list por estado),
+##    copia os índices secundários e liga dois triggers: um na tabela
+##    atual, que replica cada escrita na nova e anota o id no
+##    <patient>_partitioned_delta, e um na nova, que mantém o
+##    patient_locator (unicidade global de id e SSN).
+## 2. backfill: copia as linhas existentes em lotes por ordem de id, com
+##    FOR SHARE só nas linhas do lote; escritas concorrentes nelas esperam
+##    o lote e são replicadas por cima pelo trigger.
+## 3. cutover: confere as contagens sem lock; depois, num lock curto,
+##    compara só as linhas do delta escritas desde a contagem e troca os
+##    nomes. A tabela antiga fica como <patient>_unpartitioned e passa a
+##    receber as escritas da nova por um trigger inverso.
+## 4. rollback (volta para a tabela antiga, sem perder escritas) ou
+##    finish (remove o trigger inverso e a tabela antiga).
+##
+## Depois do cutover, configurar PATIENT_PARTITIONING e reiniciar a API:
+## os prepared statements das connections abertas apontam para a tabela
+## antiga.
+
+PATIENT_TABLE = Patient.__table__
+SCHEMA = PATIENT_TABLE.schema
+SOURCE = PATIENT_TABLE.name
+TARGET = f'{SOURCE}_partitioned'
+RETIRED = f'{SOURCE}_unpartitioned'
+DELTA = f'{TARGET}_delta'
+LOCATOR = PatientLocator.__tablename__
+
+ID = PATIENT_TABLE.c.id.name
+SSN = PATIENT_TABLE.c.SSN.name
+STATE = PATIENT_TABLE.c.state.name
+
+_preparer = postgresql.dialect().identifier_preparer
+
+
+def _q(name: str) -> str:
+    return _preparer.quote(name)
+
+
+def _table(name: str) -> str:
+    return f'{_q(SCHEMA)}.{_q(name)}'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _slug(value: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '_', value.lower()).strip('_') or 'x'
+
+
+def partition_key(layout: str) -> str:
+    if layout == 'hash':
+        return ID
+    if layout == 'list':
+        return STATE
+    raise ValueError(f'Layout de particionamento inválido: {layout}')
+
+
+def retarget_index(indexdef: str, target: str, key: str | None) -> str | None:
+    """
+    Reescreve um CREATE INDEX da tabela original para `target`.
+    Índices únicos sem a chave de partição `key` viram índices comuns: a
+    unicidade deles passa a ser garantida pelo locator. Sem `key` (tabela
+    não particionada) eles continuam únicos. A chave primária é recriada
+    à parte.
+    """
+    match = re.match(
+        r'CREATE (UNIQUE )?INDEX (\S+) ON (\S+) USING (.*)$', indexdef
+    )
+    if not match:
+        return None
+    unique, name, _, rest = match.groups()
+    columns = re.search(r'\((.*)\)', rest).group(1)
+    if (
+        unique
+        and key is not None
+        and _q(key) not in [c.strip() for c in columns.split(',')]
+    ):
+        unique = None
+    base = name.strip('"')
+    name = _q(f'{base}_{_slug(target)}'[:63])
+    return (
+        f'CREATE {unique or ""}INDEX {name} ON {_table(target)} USING {rest}'
+    )
+
+
+def partition_ddl(
+    layout: str,
+    partitions: int = 16,
+    states: list[str] | None = None,
+    source: str = SOURCE,
+    target: str = TARGET,
+) -> list[str]:
+    """
+    DDL da tabela particionada e das partições.
+    """
+    key = partition_key(layout)
+    method = 'HASH' if layout == 'hash' else 'LIST'
+    statements = [
+        f'CREATE TABLE {_table(target)} (LIKE {_table(source)} '
+        f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE) '
+        f'PARTITION BY {method} ({_q(key)})'
+    ]
+
+    if layout == 'hash':
+        statements.append(
+            f'ALTER TABLE {_table(target)} ADD PRIMARY KEY ({_q(ID)})'
+        )
+        statements.extend(
+            f'CREATE TABLE {_table(f"{target}_p{i:02d}")} '
+            f'PARTITION OF {_table(target)} '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i})'
+            for i in range(partitions)
+        )
+    else:
+        ## Sem PK: no layout por estado ela teria que incluir o estado.
+        ## A unicidade do id fica com o locator.
+        statements.append(f'CREATE INDEX ON {_table(target)} ({_q(ID)})')
+        statements.extend(
+            f'CREATE TABLE {_table(f"{target}_{_slug(state)}")} '
+            f'PARTITION OF {_table(target)} '
+            f'FOR VALUES IN ({_literal(state)})'
+            for state in sorted(set(states or []))
+        )
+        statements.append(
+            f'CREATE TABLE {_table(f"{target}_default")} '
+            f'PARTITION OF {_table(target)} DEFAULT'
+        )
+    return statements
+
+
+def locator_trigger_ddl(
+    target: str = TARGET, locator: str = LOCATOR
+) -> list[str]:
+    """
+    Trigger que mantém o locator a partir da tabela particionada. Uma
+    violação de unicidade no locator aborta a escrita, como faria a
+    constraint da tabela original.
+    """
+    function = _table(f'{locator}_sync')
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {_table(locator)} WHERE patient_id = OLD.{_q(ID)};
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {_table(locator)} (patient_id, ssn, state)
+                VALUES (NEW.{_q(ID)}, NEW.{_q(SSN)}, NEW.{_q(STATE)});
+            END IF;
+            RETURN NULL;
+        END $$
+        """,
+        f'CREATE TRIGGER {_q(f"{locator}_sync")} '
+        f'AFTER INSERT OR UPDATE OR DELETE ON {_table(target)} '
+        f'FOR EACH ROW EXECUTE FUNCTION {function}()',
+    ]
+
+
+def sync_trigger_ddl(
+    source: str = SOURCE, target: str = TARGET, delta: str | None = DELTA
+) -> list[str]:
+    """
+    Trigger que replica em `target` cada escrita feita em `source`.
+    Com `delta`, anota também o id e a transação de cada escrita, para o
+    cutover conferir só o que mudou depois da contagem.
+    """
+    function = _table(f'{target}_sync')
+    log_old = log_new = ''
+    if delta:
+        log = f'INSERT INTO {_table(delta)} (patient_id) VALUES'
+        log_old = f'{log} (OLD.{_q(ID)});'
+        log_new = f'{log} (NEW.{_q(ID)});'
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {_table(target)} WHERE {_q(ID)} = OLD.{_q(ID)};
+                {log_old}
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {_table(target)} SELECT NEW.*;
+                {log_new}
+            END IF;
+            RETURN NULL;
+        END $$
+        """,
+        f'CREATE TRIGGER {_q(f"{target}_sync")} '
+        f'AFTER INSERT OR UPDATE OR DELETE ON {_table(source)} '
+        f'FOR EACH ROW EXECUTE FUNCTION {function}()',
+    ]
+
+
+def delta_table_ddl(delta: str = DELTA) -> str:
+    return (
+        f'CREATE TABLE {_table(delta)} ('
+        f'patient_id VARCHAR NOT NULL, '
+        f'xact_id xid8 NOT NULL DEFAULT pg_current_xact_id())'
+    )
+
+
+async def _table_exists(session, name: str) -> bool:
+    result = await session.exec(
+        text('SELECT to_regclass(:name) IS NOT NULL'),
+        params={'name': f'{_q(SCHEMA)}.{_q(name)}'},
+    )
+    return result.scalar()
+
+
+async def secondary_indexes(session, source: str = SOURCE) -> list[str]:
+    result = await session.exec(
+        text(
+            'SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i '
+            'WHERE i.indrelid = to_regclass(:name) AND NOT i.indisprimary'
+        ),
+        params={'name': f'{_q(SCHEMA)}.{_q(source)}'},
+    )
+    return [row[0] for row in result.all()]
+
+
+async def prepare_partitioned_table(
+    layout: str,
+    partitions: int = 16,
+    source: str = SOURCE,
+    target: str = TARGET,
+    locator: str = LOCATOR,
+    sync: bool = True,
+) -> bool:
+    """
+    Cria a tabela particionada vazia, com índices e triggers.
+    Retorna False se ela já existe (migração em andamento).
+    """
+    async with async_session() as session:
+        if await _table_exists(session, target):
+            return False
+
+        states = []
+        if layout == 'list':
+            result = await session.exec(
+                text(
+                    f'SELECT DISTINCT {_q(STATE)} FROM {_table(source)} '
+                    f'WHERE {_q(STATE)} IS NOT NULL'
+                )
+            )
+            states = [row[0] for row in result.all()]
+
+        statements = partition_ddl(layout, partitions, states, source, target)
+        for indexdef in await secondary_indexes(session, source):
+            statement = retarget_index(indexdef, target, partition_key(layout))
+            if statement:
+                statements.append(statement)
+        statements.append(f'TRUNCATE {_table(locator)}')
+        statements.extend(locator_trigger_ddl(target, locator))
+        if sync:
+            statements.append(delta_table_ddl())
+            statements.extend(sync_trigger_ddl(source, target))
+
+        for statement in statements:
+            await session.exec(text(statement))
+        await session.commit()
+
+    logger.info(
+        'Tabela particionada criada',
+        layout=layout,
+        target=target,
+        partitions=partitions if layout == 'hash' else len(states) + 1,
+    )
+    return True
+
+
+async def _copy_batch(
+    source: str, target: str, after: str, batch_size: int
+) -> tuple[str | None, int, int]:
+    async with async_session() as session:
+        result = await session.exec(
+            text(
+                f"""
+                WITH batch AS (
+                    SELECT * FROM {_table(source)}
+                    WHERE {_q(ID)} > :after
+                    ORDER BY {_q(ID)}
+                    LIMIT :limit
+                    FOR SHARE
+                ), copied AS (
+                    INSERT INTO {_table(target)}
+                    SELECT b.* FROM batch b
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM {_table(target)} t
+                        WHERE t.{_q(ID)} = b.{_q(ID)}
+                    )
+                    RETURNING 1
+                )
+                SELECT
+                    (SELECT max({_q(ID)}) FROM batch),
+                    (SELECT count(*) FROM batch),
+                    (SELECT count(*) FROM copied)
+                """
+            ),
+            params={'after': after, 'limit': batch_size},
+        )
+        last_id, read, copied = result.one()
+        await session.commit()
+    return last_id, read, copied
+
+
+async def backfill_partitioned_table(
+    batch_size: int = 5000,
+    pause: float = 0.05,
+    after: str = '',
+    source: str = SOURCE,
+    target: str = TARGET,
+    max_retries: int = 5,
+) -> dict:
+    """
+    Copia as linhas da tabela atual para a particionada em lotes por id.
+    Pode ser interrompido e retomado (`after` = último id logado); linhas
+    já copiadas, pelo backfill ou pelo trigger, são puladas.
+    """
+    counts = {'read': 0, 'copied': 0, 'retries': 0}
+    while True:
+        for attempt in range(max_retries + 1):
+            try:
+                last_id, read, copied = await _copy_batch(
+                    source, target, after, batch_size
+                )
+                break
+            except IntegrityError:
+                ## Corrida com uma escrita nova replicada pelo trigger:
+                ## refaz o lote, que agora vai pular a linha.
+                if attempt == max_retries:
+                    raise
+                counts['retries'] += 1
+                await anyio.sleep(pause or 0.05)
+
+        if not read:
+            break
+        after = last_id
+        counts['read'] += read
+        counts['copied'] += copied
+        logger.info('Backfill de pacientes', after=after, **counts)
+        if pause:
+            await anyio.sleep(pause)
+
+    return counts
+
+
+async def _snapshot_counts(source: str, target: str) -> tuple[int, int, str]:
+    """
+    Conta as duas tabelas fora do lock, num único snapshot, e descarta do
+    delta as escritas que esse snapshot já enxerga.
+    """
+    async with async_session() as session:
+        result = await session.exec(
+            text(
+                f'SELECT (SELECT count(*) FROM {_table(source)}), '
+                f'(SELECT count(*) FROM {_table(target)}), '
+                f'pg_current_snapshot()::text'
+            )
+        )
+        source_count, target_count, snapshot = result.one()
+        await session.commit()
+
+        await session.exec(
+            text(
+                f'DELETE FROM {_table(DELTA)} '
+                f'WHERE pg_visible_in_snapshot(xact_id, '
+                f'CAST(CAST(:snapshot AS text) AS pg_snapshot))'
+            ),
+            params={'snapshot': snapshot},
+        )
+        await session.commit()
+    return source_count, target_count, snapshot
+
+
+async def cutover_partitioned_table(
+    source: str = SOURCE,
+    target: str = TARGET,
+    retired: str = RETIRED,
+    lock_timeout: str = '5s',
+    verify: bool = True,
+) -> None:
+    """
+    Troca a tabela atual pela particionada num único lock curto.
+
+    As contagens completas são conferidas antes do lock; com o lock, só
+    as linhas escritas depois da contagem (anotadas no delta pelo trigger)
+    são comparadas entre as duas tabelas. Aborta sem mudar nada se algo
+    não bater.
+
+    A tabela antiga continua recebendo as escritas (trigger inverso) até o
+    finish, para o rollback não perder nada.
+    """
+    snapshot = None
+    if verify:
+        source_count, target_count, snapshot = await _snapshot_counts(
+            source, target
+        )
+        if source_count != target_count:
+            raise RuntimeError(
+                f'Contagens diferentes: {source} tem {source_count}, '
+                f'{target} tem {target_count}. Rode o backfill de novo.'
+            )
+
+    async with async_session() as session:
+        await session.exec(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        await session.exec(
+            text(f'LOCK TABLE {_table(source)} IN ACCESS EXCLUSIVE MODE')
+        )
+        if verify:
+            result = await session.exec(
+                text(
+                    f"""
+                    SELECT count(*) FROM (
+                        SELECT DISTINCT patient_id FROM {_table(DELTA)}
+                        WHERE NOT pg_visible_in_snapshot(
+                            xact_id,
+                            CAST(CAST(:snapshot AS text) AS pg_snapshot)
+                        )
+                    ) d
+                    LEFT JOIN {_table(source)} s ON s.{_q(ID)} = d.patient_id
+                    LEFT JOIN {_table(target)} t ON t.{_q(ID)} = d.patient_id
+                    WHERE to_jsonb(s) IS DISTINCT FROM to_jsonb(t)
+                    """
+                ),
+                params={'snapshot': snapshot},
+            )
+            mismatched = result.scalar()
+            if mismatched:
+                raise RuntimeError(
+                    f'{mismatched} linhas escritas depois da contagem '
+                    f'diferem entre {source} e {target}.'
+                )
+
+        for statement in (
+            f'DROP TRIGGER {_q(f"{target}_sync")} ON {_table(source)}',
+            f'DROP FUNCTION {_table(f"{target}_sync")}()',
+            f'DROP TABLE {_table(DELTA)}',
+            f'ALTER TABLE {_table(source)} RENAME TO {_q(retired)}',
+            f'ALTER TABLE {_table(target)} RENAME TO {_q(source)}',
+            *sync_trigger_ddl(source, retired, delta=None),
+        ):
+            await session.exec(text(statement))
+        await session.commit()
+
+    logger.info('Cutover concluído', table=source, retired=retired)
+
+
+async def rollback_partitioning(
+    source: str = SOURCE,
+    target: str = TARGET,
+    retired: str = RETIRED,
+    locator: str = LOCATOR,
+    lock_timeout: str = '5s',
+) -> None:
+    """
+    Volta para a tabela sem partição depois do cutover. Ela recebeu todas
+    as escritas pelo trigger inverso; a particionada é descartada.
+    """
+    async with async_session() as session:
+        await session.exec(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        await session.exec(
+            text(f'LOCK TABLE {_table(source)} IN ACCESS EXCLUSIVE MODE')
+        )
+        for statement in (
+            f'DROP TRIGGER {_q(f"{retired}_sync")} ON {_table(source)}',
+            f'DROP FUNCTION {_table(f"{retired}_sync")}()',
+            f'ALTER TABLE {_table(source)} RENAME TO {_q(target)}',
+            f'ALTER TABLE {_table(retired)} RENAME TO {_q(source)}',
+            f'DROP TABLE {_table(target)} CASCADE',
+            f'TRUNCATE {_table(locator)}',
+        ):
+            await session.exec(text(statement))
+        await session.commit()
+
+    logger.info('Rollback do particionamento concluído', table=source)
+
+
+async def finish_partitioning(
+    source: str = SOURCE, retired: str = RETIRED
+) -> None:
+    """
+    Encerra a migração: para de replicar as escritas na tabela antiga e a
+    remove. Depois disso não há mais rollback.
+    """
+    async with async_session() as session:
+        for statement in (
+            f'DROP TRIGGER IF EXISTS {_q(f"{retired}_sync")} '
+            f'ON {_table(source)}',
+            f'DROP FUNCTION IF EXISTS {_table(f"{retired}_sync")}()',
+            f'DROP TABLE IF EXISTS {_table(retired)}',
+        ):
+            await session.exec(text(statement))
+        await session.commit()
+
+    logger.info('Tabela antiga removida', retired=retired)
+
+
+async def abort_partitioning(
+    source: str = SOURCE, target: str = TARGET, locator: str = LOCATOR
+) -> None:
+    """
+    Desfaz um prepare/backfill que ainda não passou pelo cutover.
+    """
+    async with async_session() as session:
+        for statement in (
+            f'DROP TRIGGER IF EXISTS {_q(f"{target}_sync")} ON {_table(source)}',
+            f'DROP FUNCTION IF EXISTS {_table(f"{target}_sync")}()',
+            f'DROP TABLE IF EXISTS {_table(DELTA)}',
+            f'DROP TABLE IF EXISTS {_table(target)} CASCADE',
+            f'TRUNCATE {_table(locator)}',
+        ):
+            await session.exec(text(statement))
+        await session.commit()
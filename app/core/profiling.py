@@ -0,0 +1,156 @@
+import anyio
+import cProfile
+import io
+import jwt
+import pstats
+import random
+import time
+import uuid
+
+from app.core import security
+from app.core.config import settings
+from app.core.logger import log as logger
+from pathlib import Path
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = 'x-profile'
+
+
+def _is_admin(headers: Headers) -> bool:
+    """
+    Só usuários listados em PROFILING_ADMIN_USER_IDS podem pedir profile.
+    Decodifica o JWT sem ir ao banco.
+    """
+    authorization = headers.get('authorization', '')
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+    except jwt.PyJWTError:
+        return False
+    return str(payload.get('sub')) in settings.PROFILING_ADMIN_USER_IDS
+
+
+def _prune(directory: Path, max_files: int) -> None:
+    files = sorted(directory.glob('*.prof'), key=lambda p: p.stat().st_mtime)
+    for old in files[:-max_files]:
+        old.unlink(missing_ok=True)
+
+
+def _dump(profiler: cProfile.Profile, method: str, path: str) -> Path:
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = path.strip('/').replace('/', '_') or 'root'
+    filename = (
+        f'{time.strftime("%Y%m%dT%H%M%S")}-{method}-{slug}-'
+        f'{uuid.uuid4().hex[:8]}.prof'
+    )
+    target = directory / filename
+    profiler.dump_stats(target)
+    _prune(directory, settings.PROFILING_MAX_FILES)
+    return target
+
+
+def _summary(profiler: cProfile.Profile) -> bytes:
+    buffer = io.StringIO()
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats('cumulative').print_stats(settings.PROFILING_TEXT_LIMIT)
+    return buffer.getvalue().encode()
+
+
+class ProfilingMiddleware:
+    """
+    Profiler (cProfile) por requisição, sob demanda ou por amostragem.
+
+    - Header `X-Profile: 1` (apenas admins): grava o .prof em PROFILING_DIR
+      e devolve o nome do arquivo no header `X-Profile-File`.
+    - Header `X-Profile: text`: devolve o resumo do pstats no lugar da
+      resposta.
+    - PROFILING_SAMPLE_RATE > 0: uma fração aleatória das requisições é
+      gravada no mesmo diretório, que guarda só os PROFILING_MAX_FILES
+      arquivos mais recentes.
+
+    O cProfile só aceita um profiler ativo por vez e, com asyncio, também
+    mede as outras requisições que rodam no mesmo loop enquanto ele está
+    ligado. Por isso só uma requisição é perfilada de cada vez.
+
+    Só é registrado quando PROFILING_ENABLED, então não custa nada desligado.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.lock = anyio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        mode = headers.get(PROFILE_HEADER)
+        if mode and _is_admin(headers):
+            async with self.lock:
+                await self._profile(scope, receive, send, mode)
+            return
+
+        if (
+            settings.PROFILING_SAMPLE_RATE > 0
+            and random.random() < settings.PROFILING_SAMPLE_RATE
+            and not self.lock.locked()
+        ):
+            async with self.lock:
+                await self._profile(scope, receive, send, None)
+            return
+
+        await self.app(scope, receive, send)
+
+    async def _profile(
+        self, scope: Scope, receive: Receive, send: Send, mode: str | None
+    ):
+        as_text = mode == 'text'
+        profiler = cProfile.Profile()
+        ## Com o header a resposta fica retida até o .prof ser gravado,
+        ## para poder devolver o nome do arquivo num header.
+        held: list[Message] = []
+
+        async def send_wrapper(message: Message) -> None:
+            if mode:
+                held.append(message)
+                return
+            await send(message)
+
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+
+        method, path = scope['method'], scope['path']
+        if as_text:
+            body = _summary(profiler)
+            await send(
+                {
+                    'type': 'http.response.start',
+                    'status': 200,
+                    'headers': [
+                        (b'content-type', b'text/plain; charset=utf-8'),
+                        (b'content-length', str(len(body)).encode()),
+                    ],
+                }
+            )
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        target = await anyio.to_thread.run_sync(_dump, profiler, method, path)
+        logger.info('Profile gravado', method=method, path=path, file=str(target))
+        for message in held:
+            if message['type'] == 'http.response.start':
+                message['headers'] = [
+                    *message['headers'],
+                    (b'x-profile-file', target.name.encode()),
+                ]
+            await send(message)
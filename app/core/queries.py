@@ -0,0 +1,78 @@
+from nuvie_db.nuvie.models.patient import Patient
+from nuvie_db.nuvie.models.user import User
+from sqlalchemy import func, lambda_stmt, or_
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlmodel import select
+
+from app.core.config import settings
+from app.models.patient_partition import PatientLocator
+
+## Queries quentes como lambda statements: o SQLAlchemy monta a chave de
+## cache a partir do código da lambda (uma vez só) e só extrai os valores
+## do closure a cada chamada, em vez de reconstruir e percorrer o select
+## inteiro para gerar a chave. Os valores do closure viram bind params,
+## então o SQL gerado é sempre o mesmo e o asyncpg reaproveita o prepared
+## statement da connection.
+##
+## Executar com session.scalars(...) / session.scalar(...): o session.exec
+## do SQLModel não reconhece lambdas e devolveria Rows.
+##
+## Com a tabela particionada (PATIENT_PARTITIONING), as buscas por id e SSN
+## ganham um filtro extra na chave de partição, lido do patient_locator,
+## para o Postgres podar as partições em tempo de execução em vez de
+## varrer o índice de todas elas.
+
+
+def _state_of(locator_column, value):
+    """
+    Estado do paciente segundo o locator. Pacientes sem estado ficam na
+    partição default, que precisa entrar na busca também.
+    """
+    return or_(
+        Patient.state
+        == select(PatientLocator.state)
+        .where(locator_column == value)
+        .scalar_subquery(),
+        Patient.state.is_(None),
+    )
+
+
+def patient_by_id(patient_id: str) -> StatementLambdaElement:
+    statement = lambda_stmt(
+        lambda: select(Patient).where(Patient.id == patient_id)
+    )
+    if settings.PATIENT_PARTITIONING == 'list':
+        statement += lambda s: s.where(
+            _state_of(PatientLocator.patient_id, patient_id)
+        )
+    return statement
+
+
+def patient_by_ssn(ssn: str) -> StatementLambdaElement:
+    statement = lambda_stmt(lambda: select(Patient).where(Patient.SSN == ssn))
+    if settings.PATIENT_PARTITIONING == 'hash':
+        statement += lambda s: s.where(
+            Patient.id
+            == select(PatientLocator.patient_id)
+            .where(PatientLocator.ssn == ssn)
+            .scalar_subquery()
+        )
+    elif settings.PATIENT_PARTITIONING == 'list':
+        statement += lambda s: s.where(_state_of(PatientLocator.ssn, ssn))
+    return statement
+
+
+def patients_page(skip: int, limit: int) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(Patient).offset(skip).limit(limit))
+
+
+def patients_count() -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(func.count()).select_from(Patient))
+
+
+def user_by_id(user_id) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(User.id == user_id))
+
+
+def user_by_user_name(user_name: str) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(User.user_name == user_name))
@@ -0,0 +1,195 @@
+import random
+import time
+
+from app.core.config import settings
+from app.core.logger import log as logger
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class QueryStats:
+    """
+    Contadores de SQL de uma única requisição.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.checkouts = 0
+        self.total_time = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def add(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.statements[statement] += 1
+
+
+_request_stats: ContextVar[QueryStats | None] = ContextVar(
+    'request_query_stats', default=None
+)
+
+## Resultado do cache de SQL compilado em cada execução (cache_hit do
+## ExecutionContext: CACHE_HIT, CACHE_MISS, NO_CACHE_KEY, ...).
+_compile_cache: Counter[str] = Counter()
+
+
+def _redact(parameters) -> list[str] | dict[str, str] | None:
+    """
+    Mantém só os tipos dos parâmetros, nunca os valores (dados de paciente).
+    """
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return [type(parameters).__name__]
+
+
+def _explain(conn, statement: str, parameters) -> list | None:
+    """
+    Roda EXPLAIN (ANALYZE, BUFFERS) num cursor DBAPI separado, para não
+    disparar os eventos de novo nem sobrescrever o resultado original.
+    Só SELECTs: ANALYZE executa a query de verdade. O savepoint evita que
+    uma falha no EXPLAIN aborte a transação da requisição.
+    """
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('SAVEPOINT query_monitor_explain')
+        cursor.execute(
+            f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}',
+            parameters,
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        logger.warning('Falha ao capturar EXPLAIN', error=str(e))
+        return None
+    finally:
+        try:
+            cursor.execute('ROLLBACK TO SAVEPOINT query_monitor_explain')
+        except Exception:
+            pass
+        cursor.close()
+
+
+## O início fica no ExecutionContext do statement, e não numa pilha em
+## conn.info: um statement que falha não chega ao after_cursor_execute e
+## deixaria a entrada para trás na connection do pool.
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    if context is not None:
+        context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    start = getattr(context, '_query_start_time', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+
+    cache_hit = getattr(context, 'cache_hit', None)
+    if cache_hit is not None:
+        _compile_cache[cache_hit.name.lower()] += 1
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add(statement, elapsed)
+
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms < settings.SLOW_QUERY_THRESHOLD_MS:
+        return
+
+    plan = None
+    if (
+        settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE > 0
+        and random.random() < settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    ):
+        plan = _explain(conn, statement, parameters)
+
+    logger.warning(
+        'Query lenta',
+        duration_ms=round(elapsed_ms, 2),
+        statement=statement,
+        parameters=_redact(parameters),
+        executemany=executemany,
+        plan=plan,
+    )
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.checkouts += 1
+
+
+def install_query_monitor(engine: AsyncEngine | Engine) -> None:
+    """
+    Registra os hooks de tempo/contagem de SQL e de checkouts do pool na
+    engine.
+    """
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(sync_engine.pool, 'checkout', _on_checkout)
+
+
+def compile_cache_stats(engine: AsyncEngine | Engine) -> dict:
+    """
+    Acertos e falhas do cache de SQL compilado desde o início do processo,
+    com a ocupação atual do cache da engine.
+    """
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    cache = getattr(sync_engine, '_compiled_cache', None)
+    hits = _compile_cache['cache_hit']
+    misses = _compile_cache['cache_miss']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'not_cached': {
+            outcome: count
+            for outcome, count in _compile_cache.items()
+            if outcome not in ('cache_hit', 'cache_miss')
+        },
+        'size': len(cache) if cache is not None else 0,
+        'capacity': getattr(cache, 'capacity', 0),
+    }
+
+
+@contextmanager
+def track_request_queries(method: str, path: str):
+    """
+    Conta os statements emitidos dentro do bloco e avisa quando a
+    requisição passa do limite, sinal típico de N+1.
+    """
+    stats = QueryStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+        if stats.count > settings.QUERY_COUNT_WARN_THRESHOLD:
+            logger.warning(
+                'Muitas queries na mesma requisição (possível N+1)',
+                method=method,
+                path=path,
+                query_count=stats.count,
+                pool_checkouts=stats.checkouts,
+                total_ms=round(stats.total_time * 1000, 2),
+                repeated=[
+                    {'statement': statement, 'count': count}
+                    for statement, count in stats.statements.most_common(3)
+                    if count > 1
+                ],
+            )
@@ -1,10 +1,27 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import patient, login, user
+from app.routes import patient, patient_import, login, user
 
+from app.core.compression import CompressionMiddleware
 from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware
+from app.core.db import async_engine
+from app.core.import_jobs import watch_stale_jobs
+from app.core.query_monitor import compile_cache_stats, track_request_queries
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ## Retoma importações de workers que morreram no meio do job
+    watcher = asyncio.create_task(watch_stale_jobs())
+    yield
+    watcher.cancel()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.PROJECT_NAME,
     description=settings.SERVICE_NAME,
     version='1.0.0',
@@ -20,6 +37,23 @@ app.add_middleware(
     allow_headers=['*'],
 )
 
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+        thread_threshold=settings.COMPRESSION_THREAD_THRESHOLD,
+    )
+
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+
+## Antes do router de pacientes: /imports não pode cair em /{patient_id}
+app.include_router(
+    patient_import.router,
+    prefix='/api/v1/patients/imports',
+    tags=['Importação de Pacientes'],
+)
 
 app.include_router(
     patient.router, prefix='/api/v1/patients', tags=['Pacientes']
@@ -35,13 +69,29 @@ async def health_check():
     return {'status': 'healthy', 'service': settings.SERVICE_NAME}
 
 
+if settings.QUERY_MONITOR_ENABLED:
+
+    @app.get('/health/query-cache')
+    async def query_cache_health():
+        return {
+            'compiled_cache': compile_cache_stats(async_engine),
+            'prepared_statement_cache_size': (
+                settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+            ),
+        }
+
+
 @app.middleware('http')
 async def log_requests(request, call_next):
     import time
 
     start_time = time.time()
 
-    response = await call_next(request)
+    if settings.QUERY_MONITOR_ENABLED:
+        with track_request_queries(request.method, request.url.path):
+            response = await call_next(request)
+    else:
+        response = await call_next(request)
 
     process_time = time.time() - start_time
     print(
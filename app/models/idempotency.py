@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Any
+
+from nuvie_db.nuvie.models.patient import Patient
+from sqlalchemy import Column, JSON, func
+from sqlmodel import Field, SQLModel
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """
+    Resposta armazenada de uma escrita feita com Idempotency-Key.
+    Enquanto `status_code` for nulo a requisição original está em andamento.
+    """
+
+    __tablename__ = 'idempotency_key'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    key: str = Field(primary_key=True)
+    request_hash: str
+    status_code: int | None = None
+    response_body: Any | None = Field(default=None, sa_column=Column(JSON))
+    created_at: datetime | None = Field(
+        default=None, sa_column_kwargs={'server_default': func.now()}
+    )
+    ## Renovado enquanto a requisição original roda; parado, a reserva vence
+    heartbeat_at: datetime | None = Field(
+        default=None, sa_column_kwargs={'server_default': func.now()}
+    )
+    expires_at: datetime = Field(index=True)
@@ -0,0 +1,35 @@
+from typing import Any
+
+from nuvie_db.nuvie.models.patient import PatientUpdate
+from pydantic import model_validator
+from sqlmodel import SQLModel
+
+
+class PatientBulkItem(SQLModel):
+    id: str
+    patch: PatientUpdate
+
+
+class PatientBulkUpdate(SQLModel):
+    """
+    Atualização em massa: ou `filter` + `patch` (mesma alteração para todos
+    que casam com o filtro), ou `items` com um patch por paciente.
+    """
+
+    filter: dict[str, Any] | None = None
+    patch: PatientUpdate | None = None
+    items: list[PatientBulkItem] | None = None
+
+    @model_validator(mode='after')
+    def check_mode(self):
+        by_filter = self.filter is not None or self.patch is not None
+        if by_filter == (self.items is not None):
+            raise ValueError('Informe `filter` + `patch` ou `items`')
+        if by_filter and (not self.filter or self.patch is None):
+            raise ValueError('`filter` não vazio e `patch` são obrigatórios')
+        return self
+
+
+class PatientBulkUpdateResult(SQLModel):
+    updated: int
+    not_found: list[str] = []
@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Any
+
+from nuvie_db.nuvie.models.patient import Patient
+from sqlalchemy import BigInteger, Column, JSON, func
+from sqlmodel import Field, SQLModel
+
+
+class PatientChange(SQLModel, table=True):
+    """
+    Log de alterações de pacientes, gravado na mesma transação da escrita.
+    O `seq` é o cursor usado pelo feed incremental.
+    """
+
+    __tablename__ = 'patient_change'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    seq: int | None = Field(
+        default=None,
+        sa_column=Column(BigInteger, primary_key=True, autoincrement=True),
+    )
+    patient_id: str = Field(index=True)
+    operation: str
+    changed_at: datetime | None = Field(
+        default=None, sa_column_kwargs={'server_default': func.now()}
+    )
+    data: dict[str, Any] | None = Field(default=None, sa_column=Column(JSON))
+
+
+class PatientChangePublic(SQLModel):
+    seq: int
+    patient_id: str
+    operation: str
+    changed_at: datetime
+    data: dict[str, Any] | None = None
+
+
+class PatientChangesPublic(SQLModel):
+    data: list[PatientChangePublic]
+    next_cursor: int
+    has_more: bool
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from nuvie_db.nuvie.models.patient import Patient, PatientPublic
+from sqlalchemy import func
+from sqlmodel import Field, SQLModel
+
+
+class PatientBlockingKey(SQLModel, table=True):
+    """
+    Chaves de blocking de cada paciente. Só pacientes que compartilham
+    alguma chave são comparados na detecção de duplicados.
+    """
+
+    __tablename__ = 'patient_blocking_key'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    key: str = Field(primary_key=True)
+    patient_id: str = Field(primary_key=True, index=True)
+
+
+class PatientDuplicateCandidate(SQLModel, table=True):
+    """
+    Par de pacientes possivelmente duplicados (patient_id < candidate_id).
+    """
+
+    __tablename__ = 'patient_duplicate_candidate'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    patient_id: str = Field(primary_key=True)
+    candidate_id: str = Field(primary_key=True, index=True)
+    score: float
+    updated_at: datetime | None = Field(
+        default=None,
+        sa_column_kwargs={
+            'server_default': func.now(),
+            'onupdate': func.now(),
+        },
+    )
+
+
+class PossibleDuplicate(SQLModel):
+    patient: PatientPublic
+    score: float
+
+
+class PossibleDuplicatesPublic(SQLModel):
+    data: list[PossibleDuplicate]
+    count: int
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from nuvie_db.nuvie.models.patient import Patient
+from sqlalchemy import JSON, BigInteger, Column, func
+from sqlmodel import Field, SQLModel
+
+
+class PatientImportCheckpoint(SQLModel, table=True):
+    """
+    Posição já commitada de uma importação de CSV, identificada pelo hash
+    do arquivo. Atualizada na mesma transação de cada lote.
+    """
+
+    __tablename__ = 'patient_import_checkpoint'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    file_hash: str = Field(primary_key=True)
+    byte_offset: int = Field(
+        default=0, sa_column=Column(BigInteger, nullable=False, default=0)
+    )
+    row_offset: int = 0
+    ## Contadores acumulados até aqui, para uma retomada não zerá-los
+    counts: dict | None = Field(default=None, sa_column=Column(JSON))
+    completed: bool = False
+    updated_at: datetime | None = Field(
+        default=None,
+        sa_column_kwargs={
+            'server_default': func.now(),
+            'onupdate': func.now(),
+        },
+    )
+
+
+class PatientImportRowHash(SQLModel, table=True):
+    """
+    Hash do conteúdo da última linha importada para cada paciente,
+    usado para só atualizar linhas que mudaram na origem.
+    """
+
+    __tablename__ = 'patient_import_row_hash'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    patient_id: str = Field(primary_key=True)
+    content_hash: str
+
+
+class PatientImportJob(SQLModel, table=True):
+    """
+    Importação de CSV enviada pela API e processada em background.
+    """
+
+    __tablename__ = 'patient_import_job'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    id: str = Field(primary_key=True)
+    status: str = 'queued'
+    file_name: str | None = None
+    total_bytes: int = Field(
+        default=0, sa_column=Column(BigInteger, nullable=False, default=0)
+    )
+    processed_bytes: int = Field(
+        default=0, sa_column=Column(BigInteger, nullable=False, default=0)
+    )
+    processed_rows: int = 0
+    success_count: int = 0
+    updated_count: int = 0
+    unchanged_count: int = 0
+    duplicate_count: int = 0
+    error_count: int = 0
+    error: str | None = None
+    created_at: datetime | None = Field(
+        default=None, sa_column_kwargs={'server_default': func.now()}
+    )
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    heartbeat_at: datetime | None = Field(
+        default=None, sa_column_kwargs={'server_default': func.now()}
+    )
+
+
+class PatientImportJobPublic(SQLModel):
+    id: str
+    status: str
+    file_name: str | None = None
+    total_bytes: int
+    processed_bytes: int
+    processed_rows: int
+    success_count: int
+    updated_count: int
+    unchanged_count: int
+    duplicate_count: int
+    error_count: int
+    error: str | None = None
+    progress: float
+    rows_per_second: float | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
@@ -0,0 +1,20 @@
+from nuvie_db.nuvie.models.patient import Patient
+from sqlmodel import Field, SQLModel
+
+
+class PatientLocator(SQLModel, table=True):
+    """
+    Índice global (id, SSN) -> chave de partição do paciente.
+
+    Só é preenchido quando a tabela de pacientes está particionada, por
+    trigger. Garante a unicidade de id e SSN entre partições e dá às
+    buscas por SSN (e por id, no layout por estado) o valor que o
+    Postgres precisa para podar as partições.
+    """
+
+    __tablename__ = 'patient_locator'
+    __table_args__ = {'schema': Patient.__table__.schema}
+
+    patient_id: str = Field(primary_key=True)
+    ssn: str | None = Field(default=None, unique=True)
+    state: str | None = None
@@ -1,5 +1,6 @@
 from app.core.config import settings
-from app.core.db import async_session
+from app.core.deps import SessionDep
+from app.core.queries import user_by_user_name
 from app.core.security import (
     verify_password,
     create_access_token,
@@ -7,10 +8,8 @@ from app.core.security import (
 )
 from datetime import timedelta
 from nuvie_db.nuvie.dto import Token
-from nuvie_db.nuvie.models.user import User
 from fastapi import APIRouter, HTTPException, Request, Response, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import select
 from typing import Annotated
 
 
@@ -21,20 +20,19 @@ router = APIRouter()
 async def login_access_token(
     request: Request,
     response: Response,
+    session: SessionDep,
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     Rota de login com OAuth2, retorna um acess token
     """
-    async with async_session() as session:
-        print(form_data.username)
-        statement = select(User).where(User.user_name == form_data.username)
-        result = await session.exec(statement)
-        user = result.first()
-        if not user:
-            raise HTTPException(
-                status_code=404, detail='Incorrect email or password'
-            )
+    print(form_data.username)
+    result = await session.scalars(user_by_user_name(form_data.username))
+    user = result.first()
+    if not user:
+        raise HTTPException(
+            status_code=404, detail='Incorrect email or password'
+        )
     if not verify_password(form_data.password, user.password):
         raise HTTPException(
             status_code=403, detail='Incorrect email or password'
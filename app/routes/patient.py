@@ -1,8 +1,13 @@
+import time
 import uuid
 from datetime import timezone
-from typing import Any
-from fastapi import APIRouter, HTTPException, Query
+from typing import Annotated, Any
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, select as select_columns
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from nuvie_db.nuvie.models.patient import (
     Patient,
     PatientCreate,
@@ -12,8 +17,40 @@ from nuvie_db.nuvie.models.patient import (
     PatientsPublic,
 )
 
-from app.core.db import async_session
-from app.core.deps import CurrentUser
+from app.core.changes import (
+    OP_CREATE,
+    OP_DELETE,
+    OP_UPDATE,
+    notify_patient_changes,
+    record_patient_changes,
+    wait_for_patient_changes,
+)
+from app.core.config import settings
+from app.core.dedup import (
+    affects_matching,
+    index_patients,
+    stored_duplicates,
+    unindex_patients,
+)
+from app.core.deps import CurrentUser, SessionDep, release_connection
+from app.core.idempotency import IdempotencyKeyHeader, run_idempotent
+from app.core.patient_bulk import bulk_update_by_filter, bulk_update_by_items
+from app.core.patient_import import forget_row_hashes
+from app.core.queries import (
+    patient_by_id,
+    patient_by_ssn,
+    patients_count,
+    patients_page,
+)
+from app.models.patient_bulk import PatientBulkUpdate, PatientBulkUpdateResult
+from app.models.patient_change import (
+    PatientChange,
+    PatientChangesPublic,
+)
+from app.models.patient_duplicate import (
+    PossibleDuplicate,
+    PossibleDuplicatesPublic,
+)
 
 router = APIRouter()
 
@@ -24,204 +61,452 @@ def to_naive(dt):
     return dt
 
 
+async def get_patient_fields(
+    fields: str | None = Query(
+        default=None,
+        description='Campos a retornar, separados por vírgula (ex: id,full_name)',
+    ),
+) -> list[str] | None:
+    """
+    Valida o parâmetro `fields` contra as colunas públicas do paciente.
+    """
+    if not fields:
+        return None
+
+    requested = list(
+        dict.fromkeys(f.strip() for f in fields.split(',') if f.strip())
+    )
+    allowed = PatientPublicWithDetails.model_fields.keys() & set(
+        Patient.__table__.columns.keys()
+    )
+    invalid = [f for f in requested if f not in allowed]
+    if invalid or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f'Campos inválidos: {", ".join(invalid) or fields}',
+        )
+    return requested
+
+
+PatientFields = Annotated[list[str] | None, Depends(get_patient_fields)]
+
+
+def select_patient_fields(fields: list[str]):
+    """
+    Seleciona apenas as colunas pedidas, sem carregar a entidade inteira.
+    """
+    return select_columns(*(getattr(Patient, field) for field in fields))
+
+
+def fields_response(content: Any) -> JSONResponse:
+    return JSONResponse(content=jsonable_encoder(content))
+
+
 @router.post('/', response_model=PatientPublic)
 async def create_patient(
     *,
     current_user: CurrentUser,
+    session: SessionDep,
     patient_in: PatientCreate,
+    idempotency_key: IdempotencyKeyHeader = None,
 ) -> Any:
     """
     Criar um novo paciente.
+    Com o header `Idempotency-Key`, retentativas recebem a resposta original.
     """
-    async with async_session() as session:
-        result = await session.exec(
-            select(Patient).where(Patient.SSN == patient_in.SSN)
+    response = await run_idempotent(
+        scope='patients:create',
+        user_id=current_user.id,
+        key=idempotency_key,
+        payload=patient_in,
+        response_model=PatientPublic,
+        action=lambda: _create_patient(session, patient_in),
+        session=session,
+    )
+    notify_patient_changes()
+    return response
+
+
+async def _create_patient(
+    session: AsyncSession, patient_in: PatientCreate
+) -> Patient:
+    result = await session.scalars(patient_by_ssn(patient_in.SSN))
+    existing_patient = result.first()
+
+    if existing_patient:
+        raise HTTPException(
+            status_code=400,
+            detail='Já existe um paciente cadastrado com este CPF/SSN',
         )
-        existing_patient = result.first()
 
-        if existing_patient:
-            raise HTTPException(
-                status_code=400,
-                detail='Já existe um paciente cadastrado com este CPF/SSN',
-            )
+    if patient_in.birth_date:
+        patient_in.birth_date = to_naive(patient_in.birth_date)
+    if patient_in.death_date:
+        patient_in.death_date = to_naive(patient_in.death_date)
 
-        if patient_in.birth_date:
-            patient_in.birth_date = to_naive(patient_in.birth_date)
-        if patient_in.death_date:
-            patient_in.death_date = to_naive(patient_in.death_date)
+    db_patient = Patient.model_validate(patient_in.model_dump())
+    db_patient.id = str(uuid.uuid4())
+    session.add(db_patient)
+    await index_patients(session, [db_patient])
+    await record_patient_changes(session, OP_CREATE, [db_patient])
+    ## refresh antes do commit (feito pelo run_idempotent): tudo na mesma
+    ## connection, sem pegar outra do pool depois que o commit devolve a
+    ## primeira.
+    await session.flush()
+    await session.refresh(db_patient)
 
-        db_patient = Patient.model_validate(patient_in.model_dump())
-        db_patient.id = str(uuid.uuid4())
-        session.add(db_patient)
-        await session.commit()
-        await session.refresh(db_patient)
-
-        return db_patient
+    return db_patient
 
 
 @router.get('/', response_model=PatientsPublic)
 async def read_patients(
     current_user: CurrentUser,
+    session: SessionDep,
+    fields: PatientFields,
     skip: int = 0,
     limit: int = Query(default=100, le=100),
 ) -> Any:
     """
     Recuperar lista de pacientes com paginação.
     """
-    async with async_session() as session:
-        count_result = await session.exec(select(Patient))
-        count = len(count_result.all())
+    count = await session.scalar(patients_count())
+
+    if fields:
+        result = await session.exec(
+            select_patient_fields(fields).offset(skip).limit(limit)
+        )
+        data = [dict(zip(fields, row)) for row in result.all()]
+        return fields_response({'data': data, 'count': count})
+
+    result = await session.scalars(patients_page(skip, limit))
+    patients = result.all()
+
+    return PatientsPublic(data=patients, count=count)
+
 
-        result = await session.exec(select(Patient).offset(skip).limit(limit))
-        patients = result.all()
+@router.get('/changes', response_model=PatientChangesPublic)
+async def read_patient_changes(
+    current_user: CurrentUser,
+    session: SessionDep,
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(default=500, ge=1, le=1000),
+    wait: float = Query(default=0, ge=0, le=30),
+) -> Any:
+    """
+    Recuperar alterações de pacientes posteriores ao cursor `since`.
+    Com `wait` > 0 a requisição aguarda (long-poll) até surgir alguma alteração.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        result = await session.exec(
+            select(PatientChange)
+            .where(PatientChange.seq > since)
+            .order_by(PatientChange.seq)
+            .limit(limit + 1)
+        )
+        changes = result.all()
+
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            break
+        ## Não segura a connection durante a espera do long-poll.
+        await release_connection(session)
+        await wait_for_patient_changes(
+            min(remaining, settings.PATIENT_CHANGES_POLL_INTERVAL)
+        )
 
-        return PatientsPublic(data=patients, count=count)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    return PatientChangesPublic(
+        data=changes,
+        next_cursor=changes[-1].seq if changes else since,
+        has_more=has_more,
+    )
 
 
 @router.get('/{patient_id}', response_model=PatientPublicWithDetails)
 async def read_patient(
     patient_id: str,
     current_user: CurrentUser,
+    session: SessionDep,
+    fields: PatientFields,
 ) -> Any:
     """
     Recuperar um paciente específico por ID.
     """
-    async with async_session() as session:
-        patient = await session.get(Patient, patient_id)
-        if not patient:
+    if fields:
+        result = await session.exec(
+            select_patient_fields(fields).where(Patient.id == patient_id)
+        )
+        row = result.first()
+        if not row:
             raise HTTPException(
                 status_code=404, detail='Paciente não encontrado'
             )
-        return patient
+        return fields_response(dict(zip(fields, row)))
+
+    patient = (await session.scalars(patient_by_id(patient_id))).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail='Paciente não encontrado')
+    return patient
 
 
 @router.put('/{patient_id}', response_model=PatientPublic)
 async def update_patient(
     *,
     current_user: CurrentUser,
+    session: SessionDep,
     patient_id: str,
     patient_in: PatientUpdate,
+    idempotency_key: IdempotencyKeyHeader = None,
 ) -> Any:
     """
     Atualizar um paciente existente.
+    Com o header `Idempotency-Key`, retentativas recebem a resposta original.
     """
-    async with async_session() as session:
-        patient = await session.get(Patient, patient_id)
-        if not patient:
-            raise HTTPException(
-                status_code=404, detail='Paciente não encontrado'
+    response = await run_idempotent(
+        scope=f'patients:update:{patient_id}',
+        user_id=current_user.id,
+        key=idempotency_key,
+        payload=patient_in.model_dump(exclude_unset=True),
+        response_model=PatientPublic,
+        action=lambda: _update_patient(session, patient_id, patient_in),
+        session=session,
+    )
+    notify_patient_changes()
+    return response
+
+
+async def _update_patient(
+    session: AsyncSession, patient_id: str, patient_in: PatientUpdate
+) -> Patient:
+    patient = (await session.scalars(patient_by_id(patient_id))).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail='Paciente não encontrado')
+
+    if patient_in.SSN and patient_in.SSN != patient.SSN:
+        result = await session.exec(
+            select(Patient).where(
+                Patient.SSN == patient_in.SSN, Patient.id != patient_id
             )
+        )
+        existing_patient = result.first()
 
-        if patient_in.SSN and patient_in.SSN != patient.SSN:
-            result = await session.exec(
-                select(Patient).where(
-                    Patient.SSN == patient_in.SSN, Patient.id != patient_id
-                )
+        if existing_patient:
+            raise HTTPException(
+                status_code=400,
+                detail='Já existe outro paciente cadastrado com este CPF/SSN',
             )
-            existing_patient = result.first()
 
-            if existing_patient:
-                raise HTTPException(
-                    status_code=400,
-                    detail='Já existe outro paciente cadastrado com este CPF/SSN',
-                )
+    patient_data = patient_in.model_dump(exclude_unset=True)
+    changed = [
+        field
+        for field, value in patient_data.items()
+        if getattr(patient, field) != value
+    ]
+    for field, value in patient_data.items():
+        setattr(patient, field, value)
+
+    session.add(patient)
+    if affects_matching(changed):
+        await index_patients(session, [patient])
+    await record_patient_changes(session, OP_UPDATE, [patient])
+    await session.flush()
+    await session.refresh(patient)
+
+    return patient
 
-        patient_data = patient_in.model_dump(exclude_unset=True)
-        for field, value in patient_data.items():
-            setattr(patient, field, value)
 
-        session.add(patient)
-        await session.commit()
-        await session.refresh(patient)
+@router.patch('/bulk', response_model=PatientBulkUpdateResult)
+async def bulk_update_patients(
+    *,
+    current_user: CurrentUser,
+    session: SessionDep,
+    bulk_in: PatientBulkUpdate,
+    idempotency_key: IdempotencyKeyHeader = None,
+) -> Any:
+    """
+    Atualizar vários pacientes de uma vez, por filtro ou por lista de ids.
+    """
+    response = await run_idempotent(
+        scope='patients:bulk-update',
+        user_id=current_user.id,
+        key=idempotency_key,
+        payload=bulk_in.model_dump(exclude_unset=True),
+        response_model=PatientBulkUpdateResult,
+        action=lambda: _bulk_update_patients(session, bulk_in),
+        session=session,
+    )
+    notify_patient_changes()
+    return response
+
+
+def _patch_data(patch: PatientUpdate) -> dict[str, Any]:
+    data = patch.model_dump(exclude_unset=True)
+    for field in ('birth_date', 'death_date'):
+        if data.get(field):
+            data[field] = to_naive(data[field])
+    return data
+
+
+async def _bulk_update_patients(
+    session: AsyncSession,
+    bulk_in: PatientBulkUpdate,
+) -> PatientBulkUpdateResult:
+    if bulk_in.items is not None:
+        patches: dict[str, dict[str, Any]] = {}
+        for item in bulk_in.items:
+            patches.setdefault(item.id, {}).update(_patch_data(item.patch))
+        updated, not_found = await bulk_update_by_items(session, patches)
+    else:
+        updated = await bulk_update_by_filter(
+            session, bulk_in.filter, _patch_data(bulk_in.patch)
+        )
+        not_found = []
 
-        return patient
+    return PatientBulkUpdateResult(updated=updated, not_found=not_found)
 
 
 @router.delete('/{patient_id}')
 async def delete_patient(
     patient_id: str,
     current_user: CurrentUser,
+    session: SessionDep,
 ) -> Any:
     """
     Deletar um paciente.
     """
-    async with async_session() as session:
-        patient = await session.get(Patient, patient_id)
-        if not patient:
-            raise HTTPException(
-                status_code=404, detail='Paciente não encontrado'
-            )
+    patient = (await session.scalars(patient_by_id(patient_id))).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail='Paciente não encontrado')
 
-        await session.delete(patient)
-        await session.commit()
+    await unindex_patients(session, [patient.id])
+    await forget_row_hashes(session, [patient.id])
+    await session.delete(patient)
+    await record_patient_changes(session, OP_DELETE, [patient])
+    await session.commit()
+    notify_patient_changes()
 
-        return {'message': 'Paciente deletado com sucesso'}
+    return {'message': 'Paciente deletado com sucesso'}
 
 
 @router.get('/search/by-ssn/{ssn}', response_model=PatientPublicWithDetails)
 async def search_patient_by_ssn(
     ssn: str,
     current_user: CurrentUser,
+    session: SessionDep,
+    fields: PatientFields,
 ) -> Any:
     """
     Buscar paciente por SSN.
     """
-    async with async_session() as session:
-        result = await session.exec(select(Patient).where(Patient.SSN == ssn))
-        patient = result.first()
-
-        if not patient:
-            raise HTTPException(
-                status_code=404,
-                detail='Paciente não encontrado com este CPF/SSN',
-            )
+    if fields:
+        result = await session.exec(
+            select_patient_fields(fields).where(Patient.SSN == ssn)
+        )
+    else:
+        result = await session.scalars(patient_by_ssn(ssn))
+    patient = result.first()
+
+    if not patient:
+        raise HTTPException(
+            status_code=404,
+            detail='Paciente não encontrado com este CPF/SSN',
+        )
 
-        return patient
+    if fields:
+        return fields_response(dict(zip(fields, patient)))
+    return patient
 
 
 @router.get('/search/by-name/{name}', response_model=PatientsPublic)
 async def search_patients_by_name(
     name: str,
     current_user: CurrentUser,
+    session: SessionDep,
+    fields: PatientFields,
     skip: int = 0,
     limit: int = Query(default=100, le=100),
 ) -> Any:
     """
     Buscar pacientes por nome (busca parcial).
     """
-    async with async_session() as session:
-        result = await session.exec(
-            select(Patient)
-            .where(Patient.full_name.ilike(f'%{name}%'))
-            .offset(skip)
-            .limit(limit)
-        )
-        patients = result.all()
-
-        count_result = await session.exec(
-            select(Patient).where(Patient.full_name.ilike(f'%{name}%'))
-        )
-        count = len(count_result.all())
+    statement = select_patient_fields(fields) if fields else select(Patient)
+    result = await session.exec(
+        statement.where(Patient.full_name.ilike(f'%{name}%'))
+        .offset(skip)
+        .limit(limit)
+    )
+    patients = result.all()
+
+    count_result = await session.exec(
+        select(func.count())
+        .select_from(Patient)
+        .where(Patient.full_name.ilike(f'%{name}%'))
+    )
+    count = count_result.one()
+
+    if fields:
+        data = [dict(zip(fields, row)) for row in patients]
+        return fields_response({'data': data, 'count': count})
+    return PatientsPublic(data=patients, count=count)
+
+
+@router.get(
+    '/{patient_id}/possible-duplicates',
+    response_model=PossibleDuplicatesPublic,
+)
+async def read_possible_duplicates(
+    patient_id: str,
+    current_user: CurrentUser,
+    session: SessionDep,
+    min_score: float | None = Query(default=None, ge=0, le=1),
+) -> Any:
+    """
+    Listar pacientes possivelmente duplicados deste paciente, a partir dos
+    pares já pontuados na escrita ou pelo rebuild (find_duplicates.py).
+    Só há pares acima de DEDUP_SCORE_THRESHOLD: `min_score` abaixo dele
+    não traz nada a mais.
+    """
+    patient = (await session.scalars(patient_by_id(patient_id))).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail='Paciente não encontrado')
+
+    scores = await stored_duplicates(session, patient_id, min_score)
+    result = await session.exec(
+        select(Patient).where(Patient.id.in_(list(scores)))
+    )
+    duplicates = sorted(
+        (
+            PossibleDuplicate(
+                patient=PatientPublic.model_validate(
+                    candidate, from_attributes=True
+                ),
+                score=scores[candidate.id],
+            )
+            for candidate in result.all()
+        ),
+        key=lambda duplicate: duplicate.score,
+        reverse=True,
+    )
 
-        return PatientsPublic(data=patients, count=count)
+    return PossibleDuplicatesPublic(data=duplicates, count=len(duplicates))
 
 
 @router.get('/{patient_id}/basic-data')
 async def get_patient_basic_data(
     patient_id: str,
     current_user: CurrentUser,
+    session: SessionDep,
 ) -> Any:
     """
     Recuperar dados básicos formatados do paciente.
     """
-    async with async_session() as session:
-        patient = await session.get(Patient, patient_id)
-        if not patient:
-            raise HTTPException(
-                status_code=404, detail='Paciente não encontrado'
-            )
-
-        return {
-            'patient_id': patient.id,
-            'basic_data': patient.patient_basic_data,
-        }
+    patient = (await session.scalars(patient_by_id(patient_id))).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail='Paciente não encontrado')
+
+    return {
+        'patient_id': patient.id,
+        'basic_data': patient.patient_basic_data,
+    }
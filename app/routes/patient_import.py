@@ -0,0 +1,81 @@
+import uuid
+from typing import Any
+from fastapi import APIRouter, HTTPException, Request
+
+from app.core.deps import CurrentUser, SessionDep, release_connection
+from app.core.import_jobs import (
+    job_public,
+    spool_upload,
+    start_import_job,
+    upload_path,
+)
+from app.models.patient_import import (
+    PatientImportJob,
+    PatientImportJobPublic,
+)
+
+router = APIRouter()
+
+
+@router.post(
+    '',
+    response_model=PatientImportJobPublic,
+    status_code=202,
+    openapi_extra={
+        'requestBody': {
+            'required': True,
+            'content': {
+                'text/csv': {'schema': {'type': 'string', 'format': 'binary'}}
+            },
+        }
+    },
+)
+async def create_import_job(
+    request: Request,
+    current_user: CurrentUser,
+    session: SessionDep,
+    file_name: str | None = None,
+) -> Any:
+    """
+    Enviar um CSV de pacientes para importação em background.
+    O corpo da requisição é o próprio arquivo (Content-Type: text/csv).
+    """
+    ## A cópia do upload para o disco pode demorar: não segura a connection
+    ## usada na autenticação enquanto isso.
+    await release_connection(session)
+
+    job_id = str(uuid.uuid4())
+    path = upload_path(job_id)
+    total_bytes = await spool_upload(request, path)
+
+    job = PatientImportJob(
+        id=job_id, file_name=file_name, total_bytes=total_bytes
+    )
+    session.add(job)
+    try:
+        await session.commit()
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    await session.refresh(job)
+
+    start_import_job(job_id, path)
+
+    return job_public(job)
+
+
+@router.get('/{job_id}', response_model=PatientImportJobPublic)
+async def read_import_job(
+    job_id: str,
+    current_user: CurrentUser,
+    session: SessionDep,
+) -> Any:
+    """
+    Consultar progresso e resultado de uma importação.
+    """
+    job = await session.get(PatientImportJob, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404, detail='Importação não encontrada'
+        )
+    return job_public(job)
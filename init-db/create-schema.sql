@@ -1 +1,91 @@
-CREATE SCHEMA IF NOT EXISTS nuvie;
\ No newline at end of file
+CREATE SCHEMA IF NOT EXISTS nuvie;
+
+CREATE TABLE IF NOT EXISTS nuvie.patient_change (
+    seq BIGSERIAL PRIMARY KEY,
+    patient_id VARCHAR NOT NULL,
+    operation VARCHAR NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT now(),
+    data JSON
+);
+
+CREATE INDEX IF NOT EXISTS ix_nuvie_patient_change_patient_id
+    ON nuvie.patient_change (patient_id);
+
+
+CREATE TABLE IF NOT EXISTS nuvie.idempotency_key (
+    key VARCHAR PRIMARY KEY,
+    request_hash VARCHAR NOT NULL,
+    status_code INTEGER,
+    response_body JSON,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    heartbeat_at TIMESTAMP NOT NULL DEFAULT now(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_nuvie_idempotency_key_expires_at
+    ON nuvie.idempotency_key (expires_at);
+
+
+CREATE TABLE IF NOT EXISTS nuvie.patient_import_checkpoint (
+    file_hash VARCHAR PRIMARY KEY,
+    byte_offset BIGINT NOT NULL DEFAULT 0,
+    row_offset INTEGER NOT NULL DEFAULT 0,
+    counts JSON,
+    completed BOOLEAN NOT NULL DEFAULT false,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS nuvie.patient_import_row_hash (
+    patient_id VARCHAR PRIMARY KEY,
+    content_hash VARCHAR NOT NULL
+);
+
+
+CREATE TABLE IF NOT EXISTS nuvie.patient_import_job (
+    id VARCHAR PRIMARY KEY,
+    status VARCHAR NOT NULL,
+    file_name VARCHAR,
+    total_bytes BIGINT NOT NULL DEFAULT 0,
+    processed_bytes BIGINT NOT NULL DEFAULT 0,
+    processed_rows INTEGER NOT NULL DEFAULT 0,
+    success_count INTEGER NOT NULL DEFAULT 0,
+    updated_count INTEGER NOT NULL DEFAULT 0,
+    unchanged_count INTEGER NOT NULL DEFAULT 0,
+    duplicate_count INTEGER NOT NULL DEFAULT 0,
+    error_count INTEGER NOT NULL DEFAULT 0,
+    error VARCHAR,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    heartbeat_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+
+CREATE TABLE IF NOT EXISTS nuvie.patient_blocking_key (
+    key VARCHAR NOT NULL,
+    patient_id VARCHAR NOT NULL,
+    PRIMARY KEY (key, patient_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_nuvie_patient_blocking_key_patient_id
+    ON nuvie.patient_blocking_key (patient_id);
+
+CREATE TABLE IF NOT EXISTS nuvie.patient_duplicate_candidate (
+    patient_id VARCHAR NOT NULL,
+    candidate_id VARCHAR NOT NULL,
+    score DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (patient_id, candidate_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_nuvie_patient_duplicate_candidate_candidate_id
+    ON nuvie.patient_duplicate_candidate (candidate_id);
+
+
+-- Só usado com a tabela de pacientes particionada
+-- (scripts/client/partition_patients.py), mantido por trigger.
+CREATE TABLE IF NOT EXISTS nuvie.patient_locator (
+    patient_id VARCHAR PRIMARY KEY,
+    ssn VARCHAR UNIQUE,
+    state VARCHAR
+);
@@ -0,0 +1,65 @@
+import json
+import time
+import uuid
+
+from app.core.compression import available_encoders
+
+
+def build_patients_page(size: int) -> bytes:
+    """
+    Gera uma página JSON no formato de PatientsPublic.
+    """
+    data = [
+        {
+            'id': str(uuid.uuid4()),
+            'birth_date': '1993-11-11T00:00:00',
+            'death_date': None,
+            'SSN': f'999-{i % 100:02d}-{i % 10000:04d}',
+            'full_name': f'Mr. Alexis{i} Alexis{i} Heathcote{i}',
+            'gender': 'Masculino',
+            'self_declared_color': 'Branco',
+            'civil_state': 'Solteiro',
+            'income': 71625.0 + i,
+            'address': f'{i} Jacobs Avenue',
+            'city': 'Forestdale',
+            'state': 'Massachusetts',
+            'zip_code': '02644',
+            'healthcare_coverage': '15866.26',
+        }
+        for i in range(size)
+    ]
+    return json.dumps({'data': data, 'count': size}).encode()
+
+
+def bench(encoder_cls, level: int, body: bytes, rounds: int):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        compressed = encoder_cls(level).compress_all(body)
+    elapsed = (time.perf_counter() - start) / rounds
+    return len(compressed), elapsed
+
+
+def main():
+    levels = {'gzip': [1, 6, 9], 'br': [1, 4, 9], 'zstd': [1, 3, 9]}
+    encoders = available_encoders()
+
+    print(f'{"página":>8} {"enc":>5} {"nível":>5} {"bytes":>10} '
+          f'{"razão":>6} {"ms":>8} {"MB/s":>8}')
+    for page_size in (10, 100, 1000, 10000):
+        body = build_patients_page(page_size)
+        rounds = max(1, 2000 // page_size)
+        print(f'{page_size:>8} {"-":>5} {"-":>5} {len(body):>10}')
+        for encoding, encoder_cls in encoders.items():
+            for level in levels[encoding]:
+                size, elapsed = bench(
+                    encoder_cls, level, body, rounds
+                )
+                print(
+                    f'{page_size:>8} {encoding:>5} {level:>5} {size:>10} '
+                    f'{len(body) / size:>6.1f} {elapsed * 1000:>8.2f} '
+                    f'{len(body) / elapsed / 1e6:>8.1f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import random
+import time
+
+from nuvie_db.nuvie.models.patient import Patient
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.db import async_engine, async_session
+from app.core.patient_partitioning import (
+    ID,
+    LOCATOR,
+    SCHEMA,
+    SOURCE,
+    SSN,
+    STATE,
+    prepare_partitioned_table,
+    retarget_index,
+    secondary_indexes,
+)
+
+## Compara a tabela de pacientes sem partição com os layouts hash (por id)
+## e list (por estado) em cópias nuvie.patient_bench_<layout>, cada uma
+## com o seu locator. A tabela real não é alterada.
+
+LAYOUTS = ('plain', 'hash', 'list')
+FULL_NAME = Patient.__table__.c.full_name.name
+
+
+def bench_table(layout: str) -> str:
+    return f'{SOURCE}_bench_{layout}'
+
+
+def bench_locator(layout: str) -> str:
+    return f'{LOCATOR}_bench_{layout}'
+
+
+def qualified(name: str) -> str:
+    return f'"{SCHEMA}"."{name}"'
+
+
+def lookups(layout: str) -> dict[str, str]:
+    """
+    As queries quentes no formato que app.core.queries gera para cada
+    layout, incluindo o filtro pelo locator que permite a poda.
+    """
+    table = qualified(bench_table(layout))
+    locator = qualified(bench_locator(layout))
+    by_id = f'SELECT * FROM {table} WHERE "{ID}" = :id'
+    by_ssn = f'SELECT * FROM {table} WHERE "{SSN}" = :ssn'
+    if layout == 'hash':
+        by_ssn += (
+            f' AND "{ID}" = (SELECT patient_id FROM {locator} '
+            f'WHERE ssn = :ssn)'
+        )
+    elif layout == 'list':
+        by_id += (
+            f' AND ("{STATE}" = (SELECT state FROM {locator} '
+            f'WHERE patient_id = :id) OR "{STATE}" IS NULL)'
+        )
+        by_ssn += (
+            f' AND ("{STATE}" = (SELECT state FROM {locator} '
+            f'WHERE ssn = :ssn) OR "{STATE}" IS NULL)'
+        )
+    return {
+        'patient_by_id': by_id,
+        'patient_by_ssn': by_ssn,
+        'patients_page': f'SELECT * FROM {table} OFFSET :skip LIMIT 100',
+        'patients_count': f'SELECT count(*) FROM {table}',
+    }
+
+
+async def drop_tables() -> None:
+    async with async_session() as session:
+        for layout in LAYOUTS:
+            await session.exec(
+                text(f'DROP TABLE IF EXISTS {qualified(bench_table(layout))}')
+            )
+            await session.exec(
+                text(
+                    f'DROP TABLE IF EXISTS {qualified(bench_locator(layout))}'
+                )
+            )
+            await session.exec(
+                text(
+                    'DROP FUNCTION IF EXISTS '
+                    f'{qualified(bench_locator(layout) + "_sync")}()'
+                )
+            )
+        await session.commit()
+
+
+async def create_table(layout: str, partitions: int) -> None:
+    table = bench_table(layout)
+    if layout != 'plain':
+        async with async_session() as session:
+            await session.exec(
+                text(
+                    f'CREATE TABLE {qualified(bench_locator(layout))} '
+                    f'(LIKE {qualified(LOCATOR)} INCLUDING ALL)'
+                )
+            )
+            await session.commit()
+        await prepare_partitioned_table(
+            layout,
+            partitions=partitions,
+            target=table,
+            locator=bench_locator(layout),
+            sync=False,
+        )
+        return
+
+    async with async_session() as session:
+        statements = [
+            f'CREATE TABLE {qualified(table)} (LIKE {qualified(SOURCE)} '
+            f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)',
+            f'ALTER TABLE {qualified(table)} ADD PRIMARY KEY ("{ID}")',
+        ]
+        for indexdef in await secondary_indexes(session):
+            statement = retarget_index(indexdef, table, None)
+            if statement:
+                statements.append(statement)
+        for statement in statements:
+            await session.exec(text(statement))
+        await session.commit()
+
+
+async def load_table(layout: str) -> float:
+    async with async_session() as session:
+        start = time.perf_counter()
+        await session.exec(
+            text(
+                f'INSERT INTO {qualified(bench_table(layout))} '
+                f'SELECT * FROM {qualified(SOURCE)}'
+            )
+        )
+        await session.commit()
+        return time.perf_counter() - start
+
+
+async def samples(count: int) -> list[tuple[str, str]]:
+    async with async_session() as session:
+        result = await session.exec(
+            text(
+                f'SELECT "{ID}", "{SSN}" FROM {qualified(SOURCE)} '
+                f'WHERE "{SSN}" IS NOT NULL '
+                f'ORDER BY random() LIMIT {count}'
+            )
+        )
+        return [tuple(row) for row in result.all()]
+
+
+def params_for(name: str, sample: tuple[str, str], total: int) -> dict:
+    if name == 'patient_by_id':
+        return {'id': sample[0]}
+    if name == 'patient_by_ssn':
+        return {'ssn': sample[1]}
+    if name == 'patients_page':
+        return {'skip': random.randrange(max(total - 100, 1))}
+    return {}
+
+
+async def bench_queries(
+    layout: str, rows: list[tuple[str, str]], total: int, rounds: int
+) -> dict[str, float]:
+    """
+    Tempo médio por query, em µs, sempre na mesma connection para o
+    asyncpg reaproveitar o prepared statement.
+    """
+    timings = {}
+    async with async_engine.connect() as conn:
+        for name, sql in lookups(layout).items():
+            statement = text(sql)
+            runs = rounds if name != 'patients_count' else max(rounds // 50, 3)
+            for sample in rows[:5]:
+                await conn.execute(statement, params_for(name, sample, total))
+            start = time.perf_counter()
+            for i in range(runs):
+                sample = rows[i % len(rows)]
+                result = await conn.execute(
+                    statement, params_for(name, sample, total)
+                )
+                result.all()
+            timings[name] = (time.perf_counter() - start) / runs * 1e6
+    return timings
+
+
+def scanned(plan: dict, found: list[str]) -> list[str]:
+    if 'Relation Name' in plan and plan.get('Actual Loops'):
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        scanned(child, found)
+    return found
+
+
+async def partitions_scanned(
+    layout: str, sample: tuple[str, str]
+) -> dict[str, int]:
+    """
+    Quantas tabelas a busca por id e por SSN efetivamente lê (partições
+    podadas em tempo de execução aparecem como never executed). Conta o
+    locator também.
+    """
+    counts = {}
+    async with async_session() as session:
+        for name in ('patient_by_id', 'patient_by_ssn'):
+            result = await session.exec(
+                text(
+                    'EXPLAIN (ANALYZE, FORMAT JSON) ' + lookups(layout)[name]
+                ),
+                params=params_for(name, sample, 0),
+            )
+            plan = result.scalar()[0]['Plan']
+            counts[name] = len(scanned(plan, []))
+    return counts
+
+
+async def maintenance(layout: str) -> dict[str, float]:
+    """
+    VACUUM (ANALYZE) da tabela inteira e da maior partição, e o tempo de
+    criar um índice novo.
+    """
+    table = qualified(bench_table(layout))
+    timings = {}
+    async with async_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level='AUTOCOMMIT')
+
+        start = time.perf_counter()
+        await conn.execute(text(f'VACUUM (ANALYZE) {table}'))
+        timings['vacuum_s'] = time.perf_counter() - start
+
+        ## pg_partition_tree não devolve nada para tabela sem partição.
+        result = await conn.execute(
+            text(
+                'SELECT relid::text FROM pg_partition_tree(:name) '
+                'WHERE isleaf ORDER BY pg_total_relation_size(relid) DESC'
+            ),
+            {'name': table},
+        )
+        leaves = result.scalars().all() or [table]
+        start = time.perf_counter()
+        await conn.execute(text(f'VACUUM (ANALYZE) {leaves[0]}'))
+        timings['vacuum_largest_s'] = time.perf_counter() - start
+
+        index = f'{bench_table(layout)}_bench_idx'
+        start = time.perf_counter()
+        await conn.execute(
+            text(f'CREATE INDEX "{index}" ON {table} ("{FULL_NAME}")')
+        )
+        timings['create_index_s'] = time.perf_counter() - start
+        await conn.execute(text(f'DROP INDEX {qualified(index)}'))
+
+        size = 0
+        for leaf in leaves:
+            result = await conn.execute(
+                text('SELECT pg_total_relation_size(:name)'), {'name': leaf}
+            )
+            size += result.scalar()
+        if layout != 'plain':
+            result = await conn.execute(
+                text('SELECT pg_total_relation_size(:name)'),
+                {'name': qualified(bench_locator(layout))},
+            )
+            size += result.scalar()
+        timings['size_mb'] = size / 2**20
+    return timings
+
+
+def print_table(title: str, results: dict[str, dict], fmt: str) -> None:
+    print(f'\n{title}')
+    print(f'{"":>20}' + ''.join(f'{layout:>12}' for layout in results))
+    metrics = next(iter(results.values())).keys()
+    for metric in metrics:
+        print(
+            f'{metric:>20}'
+            + ''.join(
+                f'{values[metric]:>12{fmt}}' for values in results.values()
+            )
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compara a tabela de pacientes com e sem partição.'
+    )
+    parser.add_argument(
+        '--partitions', type=int, default=settings.PATIENT_HASH_PARTITIONS
+    )
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument(
+        '--keep', action='store_true', help='Mantém as tabelas de benchmark'
+    )
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    rows = await samples(500)
+    if not rows:
+        raise SystemExit('O banco precisa de pacientes com SSN')
+
+    await drop_tables()
+    loads, queries, pruning, upkeep = {}, {}, {}, {}
+    try:
+        for layout in LAYOUTS:
+            await create_table(layout, args.partitions)
+            loads[layout] = {'load_s': await load_table(layout)}
+            upkeep[layout] = await maintenance(layout)
+
+        async with async_session() as session:
+            result = await session.exec(
+                text(f'SELECT count(*) FROM {qualified(SOURCE)}')
+            )
+            total = result.scalar()
+        for layout in LAYOUTS:
+            queries[layout] = await bench_queries(
+                layout, rows, total, args.rounds
+            )
+            pruning[layout] = await partitions_scanned(layout, rows[0])
+    finally:
+        if not args.keep:
+            await drop_tables()
+
+    print(f'{total} pacientes, {args.partitions} partições no layout hash')
+    print_table('Carga (INSERT ... SELECT), s', loads, '.2f')
+    print_table('Latência por query, µs', queries, '.1f')
+    print_table('Tabelas lidas por busca (com locator)', pruning, 'd')
+    print_table('Manutenção e tamanho', upkeep, '.2f')
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
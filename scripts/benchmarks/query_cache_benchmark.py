@@ -0,0 +1,140 @@
+import asyncio
+import sys
+import time
+
+from nuvie_db.nuvie.models.patient import Patient
+from nuvie_db.nuvie.models.user import User
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from app.core import queries
+from app.core.db import async_engine, async_session
+from app.core.query_monitor import compile_cache_stats
+
+
+def hot_queries(patient_id: str, ssn: str, user_name: str, user_id=1):
+    """
+    Pares (antes, depois) de cada query quente: o select montado a cada
+    chamada, como as rotas faziam, e o lambda statement de app.core.queries.
+    """
+    return {
+        'patient_by_id': (
+            lambda: select(Patient).where(Patient.id == patient_id),
+            lambda: queries.patient_by_id(patient_id),
+        ),
+        'patient_by_ssn': (
+            lambda: select(Patient).where(Patient.SSN == ssn),
+            lambda: queries.patient_by_ssn(ssn),
+        ),
+        'patients_page': (
+            lambda: select(Patient).offset(100).limit(100),
+            lambda: queries.patients_page(100, 100),
+        ),
+        'patients_count': (
+            lambda: select(func.count()).select_from(Patient),
+            lambda: queries.patients_count(),
+        ),
+        'user_by_id': (
+            lambda: select(User).where(User.id == user_id),
+            lambda: queries.user_by_id(user_id),
+        ),
+        'user_by_user_name': (
+            lambda: select(User).where(User.user_name == user_name),
+            lambda: queries.user_by_user_name(user_name),
+        ),
+    }
+
+
+def bench_python(build, rounds: int) -> float:
+    """
+    Custo em Python de montar o statement e gerar a chave do cache de SQL
+    compilado, que é o que roda a cada execução quando o cache acerta.
+    """
+    build()._generate_cache_key()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        build()._generate_cache_key()
+    return (time.perf_counter() - start) / rounds
+
+
+def bench_compile(build, rounds: int) -> float:
+    """
+    Custo de compilar o SQL do zero, que é o que cada falha no cache paga.
+    """
+    dialect = postgresql.asyncpg.dialect()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        build().compile(dialect=dialect)
+    return (time.perf_counter() - start) / rounds
+
+
+async def bench_db(build, rounds: int, scalar: bool) -> float:
+    async with async_session() as session:
+        execute = session.scalars if not scalar else session.scalar
+        await execute(build())
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = await execute(build())
+            if not scalar:
+                result.all()
+            session.expunge_all()
+        return (time.perf_counter() - start) / rounds
+
+
+async def sample_values() -> tuple[str, str, str, int]:
+    async with async_session() as session:
+        patient = (await session.scalars(select(Patient).limit(1))).first()
+        user = (await session.scalars(select(User).limit(1))).first()
+    if not patient or not user:
+        raise SystemExit('O banco precisa de ao menos um paciente e um usuário')
+    return patient.id, patient.SSN, user.user_name, user.id
+
+
+def print_row(name: str, before: float, after: float) -> None:
+    print(
+        f'{name:>20} {before * 1e6:>10.1f} {after * 1e6:>10.1f} '
+        f'{before / after:>7.2f}x'
+    )
+
+
+async def main():
+    rounds = 5000
+    with_db = '--db' in sys.argv
+
+    if with_db:
+        patient_id, ssn, user_name, user_id = await sample_values()
+    else:
+        patient_id, ssn, user_name, user_id = 'id', '999-00-0000', 'admin', 1
+    pairs = hot_queries(patient_id, ssn, user_name, user_id)
+
+    print('Python por execução (montar statement + chave de cache), µs')
+    print(f'{"query":>20} {"antes":>10} {"depois":>10} {"ganho":>8}')
+    for name, (before, after) in pairs.items():
+        print_row(
+            name, bench_python(before, rounds), bench_python(after, rounds)
+        )
+
+    print('\nCompilação sem cache (custo de cada cache miss), µs')
+    for name, (before, _) in pairs.items():
+        print(f'{name:>20} {bench_compile(before, rounds // 10) * 1e6:>10.1f}')
+
+    if not with_db:
+        print('\nUse --db para medir também a execução no banco configurado.')
+        return
+
+    print('\nExecução completa no banco, µs por query')
+    print(f'{"query":>20} {"antes":>10} {"depois":>10} {"ganho":>8}')
+    for name, (before, after) in pairs.items():
+        scalar = name == 'patients_count'
+        print_row(
+            name,
+            await bench_db(before, rounds // 5, scalar),
+            await bench_db(after, rounds // 5, scalar),
+        )
+    print('\nCache de SQL compilado:', compile_cache_stats(async_engine))
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
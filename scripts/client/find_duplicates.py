@@ -0,0 +1,23 @@
+import asyncio
+import sys
+
+from app.core.db import async_session
+from app.core.dedup import rebuild_duplicate_index
+
+
+async def main():
+    """
+    Recalcula o índice de blocking e os pares de possíveis duplicados
+    de todos os pacientes.
+    """
+    try:
+        summary = await rebuild_duplicate_index(async_session, batch_size=1000)
+        print(f"Detecção de duplicados concluída: {summary}")
+
+    except Exception as e:
+        print(f"Erro na detecção de duplicados: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
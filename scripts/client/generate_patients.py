@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import sys
+
+from app.core.patient_generator import seed_patients_db, write_patients_csv
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Gera pacientes sintéticos no formato do patients.csv."
+    )
+    parser.add_argument("rows", type=int, help="Quantidade de pacientes")
+    parser.add_argument(
+        "-o", "--output", default="-", help="Arquivo CSV (padrão: stdout)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.0,
+        help="Fração de linhas que são duplicatas alteradas (ex: 0.05)",
+    )
+    parser.add_argument(
+        "--truth", help="CSV com os pares (duplicata, original) gerados"
+    )
+    parser.add_argument(
+        "--db", action="store_true", help="Insere direto no banco"
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Com --db, atualiza também o índice de duplicados",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    """
+    Gera o dataset sintético em CSV ou direto no banco.
+    """
+    args = parse_args()
+
+    try:
+        if args.db:
+            summary = await seed_patients_db(
+                args.rows,
+                seed=args.seed,
+                duplicate_rate=args.duplicate_rate,
+                batch_size=args.batch_size,
+                index=args.index,
+            )
+        else:
+            summary = write_patients_csv(
+                args.output,
+                args.rows,
+                seed=args.seed,
+                duplicate_rate=args.duplicate_rate,
+                truth_path=args.truth,
+            )
+        print(f"Geração concluída: {summary}", file=sys.stderr)
+
+    except Exception as e:
+        print(f"Erro na geração: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import sys
+
+from app.core.config import settings
+from app.core.patient_partitioning import (
+    abort_partitioning,
+    backfill_partitioned_table,
+    cutover_partitioned_table,
+    finish_partitioning,
+    prepare_partitioned_table,
+    rollback_partitioning,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Migra a tabela de pacientes para um layout particionado."
+    )
+    parser.add_argument(
+        "step",
+        choices=[
+            "prepare",
+            "backfill",
+            "cutover",
+            "all",
+            "abort",
+            "rollback",
+            "finish",
+        ],
+    )
+    parser.add_argument("--layout", choices=["hash", "list"], default="hash")
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=settings.PATIENT_HASH_PARTITIONS,
+        help="Número de partições no layout hash",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument(
+        "--pause",
+        type=float,
+        default=0.05,
+        help="Pausa entre lotes, em segundos",
+    )
+    parser.add_argument(
+        "--after", default="", help="Retoma o backfill depois deste id"
+    )
+    return parser.parse_args()
+
+
+async def main():
+    """
+    Executa uma etapa (ou todas) da migração online para a tabela
+    particionada. Depois do cutover, configure PATIENT_PARTITIONING com
+    o layout escolhido e reinicie a API; rollback e finish valem só
+    depois do cutover.
+    """
+    args = parse_args()
+
+    try:
+        if args.step == "abort":
+            await abort_partitioning()
+            print("Migração desfeita.")
+            return
+
+        if args.step == "rollback":
+            await rollback_partitioning()
+            print(
+                "Rollback concluído. Remova PATIENT_PARTITIONING e "
+                "reinicie a API."
+            )
+            return
+
+        if args.step == "finish":
+            await finish_partitioning()
+            print("Tabela antiga removida.")
+            return
+
+        if args.step in ("prepare", "all"):
+            created = await prepare_partitioned_table(
+                args.layout, partitions=args.partitions
+            )
+            if not created:
+                print("Tabela particionada já existe, seguindo.")
+
+        if args.step in ("backfill", "all"):
+            summary = await backfill_partitioned_table(
+                batch_size=args.batch_size,
+                pause=args.pause,
+                after=args.after,
+            )
+            print(f"Backfill concluído: {summary}")
+
+        if args.step in ("cutover", "all"):
+            await cutover_partitioned_table()
+            print(
+                "Cutover concluído. Configure "
+                f"PATIENT_PARTITIONING={args.layout} e reinicie a API."
+            )
+
+    except Exception as e:
+        print(f"Erro na migração: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
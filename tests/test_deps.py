@@ -0,0 +1,110 @@
+import asyncio
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event, text
+
+from app.core import security
+from app.core.config import settings
+from app.core.db import async_engine
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch):
+    if not settings.SECRET_KEY:
+        monkeypatch.setattr(settings, 'SECRET_KEY', 'test-secret')
+
+
+@contextmanager
+def pool_events(events: list):
+    """
+    Registra checkouts e checkins do pool na mesma lista das mensagens
+    ASGI, para comparar a ordem.
+    """
+    engine = async_engine.sync_engine
+
+    def on_checkout(*args):
+        events.append('checkout')
+
+    def on_checkin(*args):
+        events.append('checkin')
+
+    event.listen(engine, 'checkout', on_checkout)
+    event.listen(engine, 'checkin', on_checkin)
+    try:
+        yield
+    finally:
+        event.remove(engine, 'checkout', on_checkout)
+        event.remove(engine, 'checkin', on_checkin)
+
+
+def recording(asgi_app, events: list):
+    async def wrapped(scope, receive, send):
+        async def record(message):
+            events.append(message['type'])
+            await send(message)
+
+        await asgi_app(scope, receive, record)
+
+    return wrapped
+
+
+async def authenticated_request(events: list):
+    try:
+        async with async_engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+    except Exception as e:
+        pytest.skip(f'Banco indisponível: {e}')
+
+    try:
+        transport = ASGITransport(app=recording(app, events))
+        async with AsyncClient(
+            transport=transport, base_url='http://test'
+        ) as client:
+            response = await client.post(
+                '/api/v1/users/',
+                json={
+                    'user_name': f'test-{uuid.uuid4().hex}',
+                    'password': 'x',
+                },
+            )
+            user_id = response.json()['id']
+            token = security.create_access_token(user_id, timedelta(minutes=5))
+            headers = {'Authorization': f'Bearer {token}'}
+
+            events.clear()
+            with pool_events(events):
+                response = await client.get(
+                    f'/api/v1/users/{user_id}', headers=headers
+                )
+            await client.delete(f'/api/v1/users/{user_id}', headers=headers)
+    finally:
+        await async_engine.dispose()
+    return response
+
+
+def test_authenticated_request_uses_one_checkout():
+    """
+    Autenticação e rota dividem a sessão da requisição: uma checkout só
+    (antes eram duas, uma em get_current_user e outra na rota).
+    """
+    events = []
+    response = asyncio.run(authenticated_request(events))
+
+    assert response.status_code == 200
+    assert events.count('checkout') == 1
+
+
+def test_connection_released_before_response():
+    """
+    A sessão tem scope='function' e fecha quando a rota retorna: a
+    connection volta ao pool antes do primeiro byte da resposta.
+    """
+    events = []
+    asyncio.run(authenticated_request(events))
+
+    assert events.index('checkin') < events.index('http.response.start')